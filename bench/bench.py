@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Benchmark suite for the core metarunlog operations on a synthetic basedir (see synth.py).
+# Every operation runs in a forked child process, which reports wall time and peak RSS.
+# Usage: python bench/bench.py [-nexps 200] [-nsubexps 20] [-grids 100,1000] [-o results.json] [-compare old.json]
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import resource
+import platform
+import subprocess
+from argparse import Namespace
+from os.path import join, dirname, abspath
+
+benchDir = dirname(abspath(__file__))
+repoDir  = dirname(benchDir)
+sys.path.insert(0, repoDir)
+sys.path.insert(0, benchDir)
+import synth
+
+def runInChild(func):
+    """ Run func() in a forked child. Returns (wall seconds, peak RSS kB, error or None). """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0: # child
+        os.close(rfd)
+        res = {}
+        try:
+            devnull = open(os.devnull, 'w')
+            sys.stdout = devnull # the operations print
+            t0 = time.time()
+            func()
+            res['wall'] = time.time() - t0
+        except BaseException as e:
+            res['error'] = '{}: {}'.format(type(e).__name__, e)
+        res['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(wfd, json.dumps(res))
+        os._exit(0)
+    os.close(wfd)
+    data = ''
+    while True:
+        chunk = os.read(rfd, 65536)
+        if not chunk: break
+        data += chunk
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    res = json.loads(data)
+    return res.get('wall'), res['maxrss'], res.get('error')
+
+def mrlState(basedir):
+    import metarunlog
+    os.chdir(basedir)
+    if basedir not in sys.path: sys.path.append(basedir)
+    return metarunlog.MetaRunLog(basedir)
+
+def runCmd(basedir, mode, args):
+    """ Run a subcommand like main() does, including hooks and saving the index. """
+    args.mode = mode
+    return mrlState(basedir).execWithHooks(mode, args)
+
+def clearIndex(basedir):
+    shutil.rmtree(join(basedir, 'output', '.mrl.cache'), ignore_errors=True)
+
+def operations(basedir, grids):
+    """ List of (name, params, setup, func). setup runs in the parent, func in the child. """
+    ops = []
+    noop = lambda: None
+    ops.append(('init', {'index': 'cold'}, lambda: clearIndex(basedir), lambda: mrlState(basedir)))
+    ops.append(('init', {'index': 'warm'}, noop, lambda: mrlState(basedir)))
+    for flags in [[], ['tm'], ['ghash', 'gdesc'], ['desc'], ['tm', 'ghash', 'gdesc', 'desc']]:
+        args = Namespace(**{f: (f in flags) or None for f in ['tm', 'ghash', 'gdesc', 'desc']})
+        ops.append(('ls', {'flags': ','.join(flags), 'index': 'cold'}, lambda: clearIndex(basedir),
+            lambda args=args: runCmd(basedir, 'ls', args)))
+        ops.append(('ls', {'flags': ','.join(flags), 'index': 'warm'}, noop,
+            lambda args=args: runCmd(basedir, 'ls', args)))
+    ops.append(('info', {}, noop, lambda: runCmd(basedir, 'info', Namespace(expId='1'))))
+    for nPoints in grids:
+        def setup(nPoints=nPoints):
+            with open(join(basedir, 'output', '0001', synth.confTemplFile), 'w') as fh:
+                fh.write(synth.gridTemplate(nPoints))
+        args = Namespace(expId='1', replace=True, dry=None, jobs=8, link='copy', update=None, delete=None)
+        ops.append(('makebatch', {'grid': nPoints}, setup, lambda args=args: runCmd(basedir, 'makebatch', args)))
+        args = Namespace(expId='1', replace=True, dry=True, jobs=8, link='copy', update=None, delete=None)
+        ops.append(('makebatch', {'grid': nPoints, 'dry': True}, setup, lambda args=args: runCmd(basedir, 'makebatch', args)))
+    for jobs in [1, 4]:
+        args = Namespace(expId='2', outdir=None, force=True, jobs=jobs, pagesize=None, timing=None, prune=None, lazy=None)
+        ops.append(('analyze', {'jobs': jobs, 'cache': False}, noop, lambda args=args: runCmd(basedir, 'analyze', args)))
+    args = Namespace(expId='2', outdir=None, force=None, jobs=1, pagesize=None, timing=None, prune=None, lazy=None)
+    ops.append(('analyze', {'jobs': 1, 'cache': True}, noop, lambda args=args: runCmd(basedir, 'analyze', args)))
+    for nSections in [100, 1000]:
+        def render(nSections=nSections):
+            from metarunlog import renderHtml
+            outhtml = renderHtml.HtmlFile(join(basedir, 'bench.html'))
+            outhtml.addTitle('bench')
+            for i in range(nSections):
+                outhtml.addSubExpSection('{:03d}'.format(i))
+                outhtml.addText('some *markdown* text for section {}'.format(i))
+                outhtml.addParagraph('<img src="plot_{}.png"></img>'.format(i))
+            outhtml.render()
+        ops.append(('HtmlFile.render', {'sections': nSections}, noop, render))
+    return ops
+
+def gitVersion():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=repoDir).strip()
+    except Exception:
+        return None
+
+def opKey(res):
+    return '{} {}'.format(res['name'], json.dumps(res['params'], sort_keys=True))
+
+def main():
+    parser = argparse.ArgumentParser(description='metarunlog benchmark suite')
+    parser.add_argument('-nexps', type=int, default=200)
+    parser.add_argument('-nsubexps', type=int, default=20)
+    parser.add_argument('-loglines', type=int, default=200)
+    parser.add_argument('-grids', default='100,1000', help='comma separated makebatch grid sizes')
+    parser.add_argument('-repeat', type=int, default=3, help='repetitions per operation, the fastest is reported')
+    parser.add_argument('-only', help='only run operations whose name contains this string')
+    parser.add_argument('-basedir', help='keep the synthetic basedir here instead of a temp dir')
+    parser.add_argument('-o', '--output', help='write results as json to this file')
+    parser.add_argument('-compare', help='json results of a previous run to compare against')
+    args = parser.parse_args()
+    basedir = args.basedir or tempfile.mkdtemp(prefix='mrlbench')
+    if os.path.isdir(basedir) and os.listdir(basedir):
+        sys.exit('basedir {} is not empty'.format(basedir))
+    t0 = time.time()
+    synth.makeBasedir(basedir, args.nexps, args.nsubexps, args.loglines)
+    print("Generated {} experiments x {} subExps in {:.1f}s at {}".format(args.nexps, args.nsubexps, time.time()-t0, basedir))
+    old = {}
+    if args.compare:
+        with open(args.compare) as fh:
+            old = {opKey(r): r for r in json.load(fh)['results']}
+    results = []
+    try:
+        for name, params, setup, func in operations(basedir, [int(g) for g in args.grids.split(',')]):
+            if args.only and args.only not in name: continue
+            walls, rsss, error = [], [], None
+            for i in range(args.repeat):
+                setup()
+                wall, maxrss, error = runInChild(func)
+                if error: break
+                walls.append(wall)
+                rsss.append(maxrss)
+            res = {'name': name, 'params': params}
+            if error:
+                res['error'] = error
+            else:
+                res.update({'wall_s': min(walls), 'peak_rss_kb': max(rsss)})
+            results.append(res)
+            line = '{:55s}'.format(opKey(res))
+            line += ' ERROR {}'.format(error) if error else ' {:9.4f} s {:9d} kB'.format(res['wall_s'], res['peak_rss_kb'])
+            prev = old.get(opKey(res))
+            if prev and not error and prev.get('wall_s'):
+                line += '  x{:.2f} vs {:.4f} s'.format(res['wall_s'] / prev['wall_s'], prev['wall_s'])
+            print(line)
+    finally:
+        if not args.basedir:
+            shutil.rmtree(basedir)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump({'version': gitVersion(), 'python': platform.python_version(), 'time': time.time(),
+                'config': {'nexps': args.nexps, 'nsubexps': args.nsubexps, 'loglines': args.loglines},
+                'results': results}, fh, indent=2)
+            fh.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Benchmark of the git state capture of mrl new: the shell git status + git log calls
+# against metarunlog.gitstate, on a synthetic repo with many tracked and untracked files.
+# Usage: python bench/gitstate.py [-ntracked 5000] [-nuntracked 20000] [-repeat 5] [-repo path]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from os.path import join, dirname, abspath
+
+repoDir = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, repoDir)
+from metarunlog import gitstate
+
+def makeRepo(path, nTracked, nUntracked, filesPerDir=100):
+    """ git repo with nTracked committed files and nUntracked files (eg checkpoints and logs). """
+    def write(prefix, n):
+        for i in range(n):
+            d = join(path, '{}{:04d}'.format(prefix, i // filesPerDir))
+            if not os.path.isdir(d): os.makedirs(d)
+            with open(join(d, 'f{:05d}.txt'.format(i)), 'w') as fh:
+                fh.write('{} file {}\n'.format(prefix, i))
+    if not os.path.isdir(path): os.makedirs(path)
+    subprocess.check_call(['git', 'init', '-q', path])
+    write('src', nTracked)
+    subprocess.check_call(['git', 'add', '-A'], cwd=path)
+    subprocess.check_call(['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost',
+        'commit', '-q', '-m', 'synthetic commit'], cwd=path)
+    write('ckpt', nUntracked)
+    time.sleep(1.1) # files modified in the second the index was written are re-hashed ("racy clean"), as in git
+    subprocess.check_call(['git', 'update-index', '-q', '--refresh'], cwd=path)
+
+def oldPath(path, untracked):
+    """ What mrl new did before gitstate. """
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        subprocess.check_output("git status --porcelain --untracked=" + ('normal' if untracked else 'no'), shell=True)
+        subprocess.check_output("git log -n1 --oneline", shell=True)
+    finally:
+        os.chdir(cwd)
+
+def timeit(func, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark git state capture for mrl new')
+    parser.add_argument('-ntracked', type=int, default=5000)
+    parser.add_argument('-nuntracked', type=int, default=20000)
+    parser.add_argument('-repeat', type=int, default=5, help='repetitions, the fastest is reported')
+    parser.add_argument('-repo', help='benchmark this existing repo instead of a synthetic one')
+    args = parser.parse_args()
+    path = args.repo or tempfile.mkdtemp(prefix='mrlgitbench')
+    try:
+        if not args.repo:
+            makeRepo(path, args.ntracked, args.nuntracked)
+            print("Synthetic repo with {} tracked and {} untracked files at {}".format(args.ntracked, args.nuntracked, path))
+        for untracked in [False, True]:
+            old = timeit(lambda: oldPath(path, untracked), args.repeat)
+            new = timeit(lambda: gitstate.gitState(path, untracked), args.repeat)
+            print('untracked={:5s}  shell git: {:8.4f} s  gitstate: {:8.4f} s  x{:.1f}'.format(
+                str(untracked), old, new, old / new))
+    finally:
+        if not args.repo:
+            shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Startup-time benchmark for the mrl CLI: wall time of light subcommands,
+# and a check that they don't import heavy modules.
+# Usage: python bench/startup.py [-n 20] [-maxms 150]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from os.path import join, dirname, abspath
+
+benchDir = dirname(abspath(__file__))
+repoDir  = dirname(benchDir)
+sys.path.insert(0, benchDir)
+import synth
+mrlBin  = join(repoDir, 'bin', 'mrl')
+commands = [['info', 'last'], ['last'], ['ls'], ['ls', '-desc', '-tm'], ['-h']]
+# modules that light subcommands should never import
+heavyModules = ['jinja2', 'simplejson', 'pandas', 'numpy', 'bokeh', 'markdown', 'mrl_hooks', 'pdb', 'multiprocessing']
+
+def makeBasedir(nExps):
+    return synth.makeBasedir(tempfile.mkdtemp(prefix='mrlbench'), nExps, nSubExps=5, logLines=10)
+
+def timeCommand(basedir, cmd, n):
+    env = dict(os.environ, PYTHONPATH=repoDir)
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in range(n):
+            t0 = time.time()
+            subprocess.check_call([sys.executable, mrlBin] + cmd, cwd=basedir, env=env, stdout=devnull)
+            times.append(time.time() - t0)
+    return sorted(times)[len(times) // 2] * 1000.
+
+def importedHeavyModules(basedir, cmd):
+    code = ("import sys; sys.argv = {!r}; import metarunlog; metarunlog.main(); "
+            "sys.stderr.write(' '.join(m for m in sys.modules if m.split('.')[0] in {!r}))").format(['mrl'] + cmd, heavyModules)
+    env = dict(os.environ, PYTHONPATH=repoDir)
+    with open(os.devnull, 'w') as devnull:
+        p = subprocess.Popen([sys.executable, '-c', code], cwd=basedir, env=env, stdout=devnull, stderr=subprocess.PIPE)
+        err = p.communicate()[1]
+    return sorted(set(err.split()))
+
+def main():
+    parser = argparse.ArgumentParser(description='mrl startup-time benchmark')
+    parser.add_argument('-n', type=int, default=20, help='runs per command, median is reported')
+    parser.add_argument('-nexps', type=int, default=200, help='number of experiments in the synthetic outdir')
+    parser.add_argument('-maxms', type=float, help='fail if a command median exceeds this many ms')
+    args = parser.parse_args()
+    basedir = makeBasedir(args.nexps)
+    failed = False
+    try:
+        t0 = time.time()
+        with open(os.devnull, 'w') as devnull:
+            for i in range(args.n):
+                subprocess.check_call([sys.executable, '-c', 'pass'], stdout=devnull)
+        baseline = (time.time() - t0) / args.n * 1000.
+        print("{:24s} {:8.1f} ms".format('python -c pass', baseline))
+        for cmd in commands:
+            ms = timeCommand(basedir, cmd, args.n)
+            heavy = importedHeavyModules(basedir, cmd) if cmd != ['-h'] else []
+            status = ''
+            if heavy:
+                status += ' imports ' + ','.join(heavy)
+                failed = True
+            if args.maxms and ms > args.maxms:
+                status += ' SLOW'
+                failed = True
+            print("{:24s} {:8.1f} ms{}".format('mrl ' + ' '.join(cmd), ms, status))
+    finally:
+        shutil.rmtree(basedir)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
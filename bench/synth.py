@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Synthetic basedir generator for the benchmarks: experiments with .mrl files, notes,
+# config templates, subExps with fake logs, done markers, and stub analysis functions.
+# Usage: python bench/synth.py outpath [-nexps 100] [-nsubexps 20]
+
+import os
+import sys
+import json
+import random
+import argparse
+from os.path import join
+
+confTemplFile = 'conf.lua'
+
+mrlAnalyzeStub = '''# stub analysis functions for the metarunlog benchmarks
+from os.path import join
+
+def benchOverview(expDir, outdir, subExpIds, Dparams):
+    return [(Dparams, 'table', None)]
+
+def benchSubExp(subExpDir, outdir, Dparams, subExpId):
+    with open(join(subExpDir, 'output.log')) as fh:
+        vals = [float(x) for x in fh]
+    return [('min {} max {} n {}'.format(min(vals), max(vals), len(vals)), 'text', None)]
+'''
+
+def gridTemplate(nPoints):
+    """ conf template with MRL:grid instructions expanding into nPoints (rounded to a product of 10s) subExps. """
+    lines = ['local cfg = {']
+    grid = []
+    n, i = nPoints, 0
+    while n > 1:
+        size = min(n, 10)
+        grid.append(('p{}'.format(i), [round(0.1 * j, 3) for j in range(size)]))
+        n = (n + size - 1) // size
+        i += 1
+    lines += ['    {} = {{{{{}}}}},'.format(k, k) for k, v in grid]
+    lines += ['    numLayers = 5', '}']
+    lines += ["-- MRL:grid['{}'] = {}".format(k, v) for k, v in grid]
+    return '\n'.join(lines) + '\n'
+
+def writeJson(fn, obj):
+    with open(fn, 'w') as fh:
+        json.dump(obj, fh, indent=2)
+        fh.write('\n')
+
+def makeBasedir(basedir, nExps=100, nSubExps=20, logLines=200, doneFrac=0.8, seed=0):
+    """ Populate basedir (created if needed) with a synthetic project. Returns basedir. """
+    rnd = random.Random(seed)
+    if not os.path.isdir(basedir): os.makedirs(basedir)
+    outdir = join(basedir, 'output')
+    os.mkdir(outdir)
+    writeJson(join(basedir, '.mrl.cfg'), {
+        'name': 'bench', 'outdir': 'output', 'hooks': {}, 'copyFiles': [confTemplFile],
+        'confTemplFile': confTemplFile, 'analysis_webdir': '',
+        'analysis_overview': {'benchOverview': []}, 'analysis_subexp': {'benchSubExp': []}})
+    with open(join(basedir, 'mrl_analyze.py'), 'w') as fh:
+        fh.write(mrlAnalyzeStub)
+    template = gridTemplate(nSubExps)
+    for expId in range(1, nExps+1):
+        expDir = join(outdir, '{:04d}'.format(expId))
+        os.mkdir(expDir)
+        writeJson(join(expDir, '.mrl'), {'expId': expId, 'basedir': basedir, 'gitFailUntracked': 'no',
+            'gitHash': '{:07x}'.format(rnd.getrandbits(28)), 'gitDescription': 'synthetic commit {}'.format(expId),
+            'timestamp': '2017-01-01T00:00:00', 'user': 'bench', 'description': 'synthetic experiment {}'.format(expId)})
+        with open(join(expDir, '.mrl.note'), 'w') as fh:
+            fh.write('### synthetic experiment {}\n#### Goal\n\n#### Observations\n\n#### Conclusions\n'.format(expId))
+        with open(join(expDir, confTemplFile), 'w') as fh:
+            fh.write(template)
+        if rnd.random() < doneFrac:
+            open(join(expDir, '.mrl.done'), 'w').close()
+        for subExpId in range(1, nSubExps+1):
+            subExpDir = join(expDir, '{:03d}'.format(subExpId))
+            os.mkdir(subExpDir)
+            params = {'lr': rnd.choice([0.01, 0.04, 0.1]), 'wdecay': rnd.choice([0.1, 1.0, 10.0]),
+                    'subExpId': '{:03d}'.format(subExpId)}
+            writeJson(join(subExpDir, '.mrl'), {'params': params})
+            with open(join(subExpDir, confTemplFile), 'w') as fh:
+                fh.write('local cfg = {{ lr = {lr}, wdecay = {wdecay} }}\n'.format(**params))
+            with open(join(subExpDir, 'output.log'), 'w') as fh:
+                fh.write(''.join('{:.6f}\n'.format(rnd.random()) for i in range(logLines)))
+    return basedir
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic metarunlog basedir')
+    parser.add_argument('basedir')
+    parser.add_argument('-nexps', type=int, default=100)
+    parser.add_argument('-nsubexps', type=int, default=20)
+    parser.add_argument('-loglines', type=int, default=200)
+    parser.add_argument('-donefrac', type=float, default=0.8)
+    parser.add_argument('-seed', type=int, default=0)
+    args = parser.parse_args()
+    print(makeBasedir(args.basedir, args.nexps, args.nsubexps, args.loglines, args.donefrac, args.seed))
@@ -2,31 +2,22 @@
 # Metarunlog, experiment management tool.
 # Author: Tom Sercu
 # Date: 2015-01-23
+# NOTE keep module-level imports light, mrl is invoked often (ls, info last, tab completion).
+# Heavier modules (jinja2, pandas, ..) are imported inside the subcommand that needs them.
 
 from metarunlog import cfg # NOTE cfg is modified by MetaRunLog._loadBasedirConfig() with custom configuration.
 from metarunlog.exceptions import *
-from metarunlog.util import nowstring, sshify, _decode_dict, _decode_list, get_commit
-from metarunlog.confParser import ConfParser
+from metarunlog.util import nowstring, sshify, _decode_dict, _decode_list, _decode_hook, jsonErrorMsg
+from metarunlog.expIndex import ExpIndex
+from metarunlog.tree import Experiment, SubExperiment, listSubExps, loadDotMrl
+from metarunlog import profiler
 import os
 import sys
-import math
 from os import listdir
 from os.path import isdir, isfile, join, relpath, expanduser
 import argparse
-import subprocess
-try:
-    import simplejson as json # way better error messaging
-except:
-    import json
-import pdb
-import datetime
+import json
 from collections import OrderedDict
-from shutil import copy as shcopy
-import shutil
-import jinja2
-from jinja2 import Template, Environment, meta
-import itertools
-import getpass
 
 DEBUG = True
 
@@ -66,7 +57,27 @@ class MetaRunLog:
         self._loadBasedirConfig()
         self.outdir  = join(self.basedir, cfg.outdir)
         if not isdir(self.outdir): raise InvalidOutDirException("Need output directory " + self.outdir + "  Fix your .mrl.cfg file")
-        self.expDirList = sorted([x for x in listdir(self.outdir) if self._checkValidExp(x)])
+        self.index = ExpIndex(self.outdir, cfg.cacheDir, cfg.singleExpFormat)
+        self._exps = {} # expId -> Experiment
+        self._expNameLen = len(self._fmtSingleExp(0))
+        self.expDirList = self.index.getExpDirList(self._checkValidExp)
+        self.expList = [int(x) for x in self.expDirList]
+        self.lastExpId = None if not self.expList else self.expList[-1]
+
+    def exp(self, expId):
+        """ The Experiment for expId (int, digit string, 'last' or path), memoized. """
+        expId = self._resolveExpId(expId)
+        if expId not in self._exps:
+            self._exps[expId] = Experiment(self, expId)
+        return self._exps[expId]
+
+    def experiments(self):
+        """ All Experiments, oldest first. """
+        return [self.exp(expId) for expId in self.expList]
+
+    def _refreshExpList(self):
+        """ Re-list the experiments, for long-running commands (watch, serve) that see new ones appear. """
+        self.expDirList = self.index.getExpDirList(self._checkValidExp)
         self.expList = [int(x) for x in self.expDirList]
         self.lastExpId = None if not self.expList else self.expList[-1]
 
@@ -77,6 +88,8 @@ class MetaRunLog:
                 for k,v in bconf.iteritems():
                     setattr(cfg,k,v)
             return True
+        except ValueError as e:
+            raise NoBasedirConfig(self.basedir, jsonErrorMsg(join(self.basedir, '.mrl.cfg'), e))
         except Exception as e:
             raise NoBasedirConfig(self.basedir, str(e))
 
@@ -87,12 +100,14 @@ class MetaRunLog:
         expConfig['basedir'] = self.basedir
         gitclean = not bool(args.notclean)
         expConfig['gitFailUntracked']= args.gitFailUntracked
-        untracked = 'no' if args.gitFailUntracked == 'no' else 'normal'
-        uncommited = subprocess.check_output("git status --porcelain --untracked=" + untracked, shell=True)
-        #print "uncommited: ", uncommited
+        import getpass
+        from metarunlog.gitstate import gitState
+        with profiler.span('gitState'):
+            gstate = gitState(self.basedir, untracked=args.gitFailUntracked != 'no')
+        uncommited = '\n'.join(gstate.changes)
         if gitclean and uncommited:
             raise NoCleanStateException("new: uncommited files -- please commit changes first\n" + uncommited)
-        expConfig['gitHash'], expConfig['gitDescription'] = get_commit()
+        expConfig['gitHash'], expConfig['gitDescription'] = gstate.shortHash, gstate.description
         if not gitclean and uncommited: expConfig['gitHash'] += '-sloppy'
         expConfig['timestamp'] = nowstring()
         expConfig['user'] = getpass.getuser()
@@ -118,22 +133,35 @@ class MetaRunLog:
         self._putEmptyNote(expDir, expConfig['description'])
         self.lastExpId = expId
         self.expList.append(expId)
+        self.expDirList.append(self._fmtSingleExp(expId))
+        self.index.invalidate()
+        self.exp(expId).invalidate()
         return expDir
 
     def info(self, args):
         """ load info from experiment id and print it """
         expId, expDir, expConfig = self._loadExp(args.expId)
-        subExpList = self._getSubExperiments(expDir)
+        exp = self.exp(expId)
+        subExpList = exp.subExpIds
         items = ['',expDir,'']
         maxkeylen = max(len(k) for k,v in expConfig.iteritems())
         items += ["%*s : %.80s" % (maxkeylen,k,str(v)) for k,v in expConfig.iteritems()]
         items += ["%*s : %.80s" % (maxkeylen, 'subExperiments', str(subExpList))]
+        if exp.archived:
+            from metarunlog.archive import archiveFn
+            items += ["%*s : %.80s" % (maxkeylen, 'archived', join(expDir, archiveFn))]
+        if subExpList:
+            paramList = exp.params
+            varied = sorted(set(k for params in paramList for k, v in params.iteritems()
+                if k != 'subExpId' and v != paramList[0].get(k)))
+            items += ["%*s : %.80s" % (maxkeylen, 'varied params', ', '.join('{} ({} values)'.format(
+                k, len(set(repr(params.get(k)) for params in paramList))) for k in varied))]
         return "\n".join(items)
 
     def ls(self, args):
-        for expId in self.expList[::-1]:
-            expConfig = self._getExpConf(expId)
-            row = self._fmtSingleExp(expId)
+        for exp in self.experiments()[::-1]:
+            expConfig = exp.conf
+            row = exp.name
             if args.tm:
                 row += "\t" + expConfig['timestamp']
             if args.ghash:
@@ -141,42 +169,138 @@ class MetaRunLog:
             if args.gdesc:
                 row += "\t" + expConfig['gitDescription']
             if args.desc:
-                expDir = self._getExpDir(expId)
-                row += "\t" + self._expIsDoneIndicator(expDir) + expConfig['description']
+                row += "\t" + ('   ' if exp.done else '** ') + expConfig['description']
             print row
         return ""
 
     def makebatch(self, args):
+        import shutil
+        from multiprocessing.pool import ThreadPool
+        from metarunlog.confParser import ConfParser
+        from metarunlog.util import copyFile, chunked
         expId, expDir, expConfig = self._loadExp(args.expId)
-        # check if already expanded in batch and cancel
-        oldSubExpList = self._getSubExperiments(expDir)
-        if oldSubExpList:
-            if args.replace:
-                # just remove all these subfolders. Drastic but it wouldn't make sense to keep results from old config files.
-                print "Will remove all old subexperiments: {}".format(oldSubExpList)
-                for subExp in oldSubExpList:
-                    shutil.rmtree(join(expDir, subExp))
-            else:
-                raise BatchException("Experiment {} is already expanded into subexperiments: {}".\
-                        format(expId, str(oldSubExpList)))
-        # make ConfParser object
-        confP = ConfParser(join(expDir, cfg.confTemplFile))
+        self._checkNotArchived(self.exp(expId), 'makebatch')
+        # make ConfParser object, the expansion itself is lazy
+        with profiler.span('ConfParser.parse'):
+            confP = ConfParser(join(expDir, cfg.confTemplFile), join(self.outdir, cfg.cacheDir, 'jinja'))
+        nSubExps = len(confP)
         # check if ConfParser output is non-empty
-        if not confP.output:
+        if not nSubExps:
             err = "ConfParser output is empty, are you sure {} is a batch template?"
             err = err.format(join(expDir, cfg.confTemplFile))
             raise BatchException(err)
-        # generate output directories, write the output config files
-        for i, params, fileContent in confP.output:
-            self._newSubExp(expDir, i, {'params': params}, fileContent)
+        exp = self.exp(expId)
+        oldSubExpList = exp.subExpIds
+        if args.update and oldSubExpList:
+            # only write the new grid points, keep the subExps whose params are still in the grid
+            with profiler.span('makebatch.diff'):
+                keptRows, newPoints, removeList = self._diffBatch(exp, confP)
+            if args.dry:
+                return "Template {} expands into {} subExperiments for expId {}: {} unchanged, {} new, {} to remove {}.".format(
+                        join(expDir, cfg.confTemplFile), nSubExps, expId, len(keptRows), len(newPoints),
+                        len(removeList), removeList)
+            outputs = confP.renderPoints(newPoints)
+            nSubExps = len(newPoints)
+        else:
+            if args.dry:
+                return "Template {} expands into {} subExperiments for expId {}.".format(
+                        join(expDir, cfg.confTemplFile), nSubExps, expId)
+            # check if already expanded in batch and cancel
+            if oldSubExpList and not args.replace:
+                raise BatchException("Experiment {} is already expanded into subexperiments: {}".\
+                        format(expId, str(oldSubExpList)))
+            keptRows, removeList = [], oldSubExpList
+            outputs = confP.iterOutput()
+        if args.link == 'symlink' and not cfg.blobStore:
+            raise BatchException("-link symlink needs blobStore enabled in .mrl.cfg")
+        # build all subExps in a staging dir, then move them into place.
+        stagingDir = join(expDir, '.mrl.staging')
+        if isdir(stagingDir): shutil.rmtree(stagingDir) # leftover from crashed makebatch
+        os.mkdir(stagingDir)
+        pool = ThreadPool(args.jobs)
+        try:
+            newSubExp = lambda (i, params, fileContent): self._newSubExp(expDir, i, {'params': params},
+                    fileContent, stagingDir, args.link)
+            rows = list(keptRows) # (subExpId, params) for the manifest
+            progress = sys.stdout.isatty()
+            nDone = 0
+            # chunks keep memory bounded, pool.map would consume the whole generator
+            for chunk in chunked(outputs, 64 * args.jobs):
+                pool.map(newSubExp, chunk)
+                rows += [(self._fmtSubExp(i), params) for i, params, fileContent in chunk]
+                nDone += len(chunk)
+                if progress:
+                    sys.stdout.write("\rWrote {}/{} subExperiments".format(nDone, nSubExps))
+                    sys.stdout.flush()
+            if progress: sys.stdout.write("\n")
+            archiveDir = join(expDir, '.mrl.removed', nowstring()) if args.update and not args.delete else None
+            with profiler.span('makebatch.swapInSubExps'):
+                self._swapInSubExps(expDir, stagingDir, removeList, archiveDir)
+            with profiler.span('makebatch.manifest'):
+                from metarunlog import manifest
+                manifest.write(expDir, sorted(rows), {'bodyHash': confP.bodyHash})
+        finally:
+            pool.terminate()
+            shutil.rmtree(stagingDir, ignore_errors=True)
+        # new subExps still have to run
+        if nDone and isfile(join(expDir, '.mrl.done')):
+            os.remove(join(expDir, '.mrl.done'))
+            print "Experiment {} has new subexperiments, no longer marked as done".format(expId)
         # update the current .mrl file
-        subExpList = self._getSubExperiments(expDir)
+        exp.invalidate()
+        subExpList = exp.subExpIds
+        if len(subExpList) > 20:
+            subExpList = '{} .. {} ({} total)'.format(subExpList[0], subExpList[-1], len(subExpList))
+        if args.update and oldSubExpList:
+            return "Kept {} unchanged subExperiments, added {}, removed {}{} for expId {}.\n".format(len(keptRows),
+                    [self._fmtSubExp(i) for i, params in newPoints], removeList,
+                    ' (moved to {})'.format(self._relpathUser(archiveDir)) if archiveDir and removeList else '', expId)
         return "Generated subExperiments {} for expId {}.\n".format(subExpList, expId)
 
+    def _diffBatch(self, exp, confP):
+        """
+        Match the grid points of confP against the params of the existing subExps of exp.
+        Returns ([(subExpId, params)] kept, [(i, params)] new with fresh ids after the existing ones, [subExpId] to remove).
+        Raises BatchException if the template itself changed, since then the kept subExps would render differently.
+        """
+        from metarunlog import manifest
+        from metarunlog.confParser import stripMrlLines
+        key = lambda params: json.dumps({k: v for k, v in params.iteritems() if k != 'subExpId'}, sort_keys=True)
+        existing = {} # params key -> [subExpIds], duplicates are matched in order
+        for subExpId, params in zip(exp.subExpIds, exp.params):
+            existing.setdefault(key(params), []).append(subExpId)
+        kept, newPoints = [], []
+        nextId = max(int(subExpId) for subExpId in exp.subExpIds) + 1
+        for i, params in confP.iterParams():
+            ids = existing.get(key(params))
+            if ids:
+                kept.append((ids.pop(0), params))
+            else:
+                params['subExpId'] = self._fmtSubExp(nextId)
+                newPoints.append((nextId, params))
+                nextId += 1
+        removeList = sorted(sum(existing.values(), []))
+        bodyHash = manifest.readHeader(exp.path).get('bodyHash')
+        changed = bodyHash is not None and bodyHash != confP.bodyHash
+        if bodyHash is None: # older manifest: compare the rendered configs
+            for subExpId, params in kept:
+                with open(join(exp.path, subExpId, cfg.confTemplFile)) as fh:
+                    old = fh.read()
+                if stripMrlLines(old) != stripMrlLines(confP.renderFromParams(dict(params, subExpId=subExpId))):
+                    changed = True
+                    break
+        if changed:
+            raise BatchException("The template {} changed in more than its MRL lines, the existing subExps don't match it anymore. "
+                    "Use -replace to regenerate all subExps.".format(cfg.confTemplFile))
+        kept = [(subExpId, exp.params[exp.subExpIds.index(subExpId)]) for subExpId, params in kept]
+        return kept, newPoints, removeList
+
     def analyze(self, args):
         ## Load modules only needed for analyzing and rendering the html file
         import pandas as pd
         import renderHtml
+        import cgi
+        from metarunlog.analysis import runAnalysisCalls, AnalysisCache
         try:
             import mrl_analyze
         except Exception as e:
@@ -186,70 +310,351 @@ class MetaRunLog:
         outdir = args.outdir if args.outdir else join(expDir, cfg.analysis_outdir)
         if not os.path.exists(outdir): os.mkdir(outdir)
         # load the params into dataframe
-        subExpIds = self._getSubExperiments(expDir)
+        exp = self.exp(expId)
+        subExpIds = exp.subExpIds
         if not subExpIds:
             raise InvalidExpIdException("Exp {} not expanded into subExps".format(expId))
-        paramList = [self._loadSubExp(join(expDir,subExpId))['params'] for subExpId in subExpIds]
+        with profiler.span('loadParams'):
+            paramList = exp.params
         Dparams = pd.DataFrame(paramList, index=subExpIds)
-        outhtml = renderHtml.HtmlFile()
+        pageSize = cfg.analysis_pageSize if args.pagesize is None else args.pagesize
+        outhtml = renderHtml.HtmlFile(join(outdir, cfg.analysis_outfn), pageSize,
+                cfg.analysis_lazy if args.lazy is None else args.lazy, args.jobs, cfg.analysis_thumbWidth, cfg.analysis_tableRows)
         title = '{} {} - {}'.format(cfg.name, cfg.singleExpFormat.format(expId=expId), expConfig['timestamp'].split('T')[0])
         if 'description' in expConfig and expConfig['description']: title += ' - ' + expConfig['description']
-        outhtml.addTitle(self._expIsDoneIndicator(expDir) + title)
+        outhtml.addTitle(('   ' if exp.done else '** ') + title)
         outhtml.parseNote(join(expDir, cfg.note_fn))
         # TODO keep analysis functions in order by using ordereddict in .mrl.cfg and cfg.py
         #### (1) analysis_overview functions
         for funcname, xtrargs in sorted(cfg.analysis_overview.items()):
             outhtml.addHeader('{} - {}'.format('overview', funcname), 1, funcname)
-            retval = getattr(mrl_analyze, funcname)(expDir, outdir, subExpIds, Dparams, *xtrargs)
+            with profiler.span('overview:' + funcname, 'analysis'):
+                retval = getattr(mrl_analyze, funcname)(expDir, outdir, subExpIds, Dparams, *xtrargs)
             outhtml.addRetVal(retval)
-        #### (2) per exp functions
-        for subExpId in subExpIds:
-            subExpDir = join(expDir, subExpId)
-            outhtml.addHeader('{} - {}'.format('subExp', subExpId), 1, subExpId)
-            for funcname, xtrargs in cfg.analysis_subexp.items():
-                outhtml.addHeader('{}'.format(funcname), 2)
-                retval = getattr(mrl_analyze, funcname)(subExpDir, outdir, Dparams, subExpId, *xtrargs)
+        #### (2) per exp functions, possibly in parallel. Results come back in call order.
+        if not exp.archived: # archived exps were ingested when they were packed
+            self._ingestMetrics(expDir, subExpIds, args.jobs)
+        calls = [(subExpId, funcname, (join(expDir, subExpId), outdir, Dparams, subExpId) + tuple(xtrargs))
+                for subExpId in subExpIds for funcname, xtrargs in cfg.analysis_subexp.items()]
+        lastSubExpId = None
+        cache = AnalysisCache(join(outdir, cfg.cacheDir))
+        for subExpId, funcname, retval, err in runAnalysisCalls(calls, args.jobs, cache, args.force):
+            if subExpId != lastSubExpId:
+                outhtml.addSubExpSection(subExpId)
+                lastSubExpId = subExpId
+            outhtml.addHeader('{}'.format(funcname), 2)
+            if err:
+                print("Analysis function {} failed on subExp {}:\n{}".format(funcname, subExpId, err))
+                outhtml.addParagraph('<pre>{} failed:\n{}</pre>'.format(funcname, cgi.escape(err)))
+            else:
                 outhtml.addRetVal(retval)
+        if args.timing:
+            outhtml.addHeader('timing', 1, 'timing')
+            outhtml.addTable(profiler.summaryTable())
         #### (3) render and optionally copy over to webdir
-        outhtml.render(join(outdir, cfg.analysis_outfn))
+        with profiler.span('HtmlFile.render'):
+            outhtml.render()
         if cfg.analysis_webdir:
-            webdir = join(cfg.analysis_webdir, self._fmtSingleExp(expId))
-            subprocess.call("rsync -az {}/* {}/".format(outdir, webdir), shell=True)
-            print "Copied to webdir {}".format(webdir)
+            self._publish(expId, outdir, args.prune)
+
+    def publish(self, args):
+        """ Copy the changed files of the analysis outdir to the webdir. """
+        expId, expDir, expConfig = self._loadExp(args.expId)
+        if not cfg.analysis_webdir:
+            return "No analysis_webdir configured in .mrl.cfg"
+        self._publish(expId, args.outdir if args.outdir else join(expDir, cfg.analysis_outdir), args.prune)
+
+    def _publish(self, expId, outdir, prune):
+        from metarunlog.publish import publish
+        webdir = join(cfg.analysis_webdir, self._fmtSingleExp(expId))
+        with profiler.span('publish'):
+            copied, unchanged, pruned = publish(outdir, webdir, join(outdir, cfg.cacheDir, 'publish.json'),
+                    prune=prune or cfg.analysis_webPrune, skipDirs=[cfg.cacheDir])
+        print "Copied {} changed files to webdir {} ({} unchanged, {} pruned)".format(copied, webdir, unchanged, pruned)
+
+    def run(self, args):
+        """ Run the command template cfg.run_cmd for every subExp, with a bounded number of jobs per host. """
+        from jinja2 import Template
+        from metarunlog.runner import Job, Scheduler, parseHosts
+        expId, expDir, expConfig = self._loadExp(args.expId)
+        exp = self.exp(expId)
+        self._checkNotArchived(exp, 'run')
+        if not exp.subExpIds:
+            raise BatchException("No subExps in {}, run makebatch first".format(expDir))
+        template = Template(args.cmd or cfg.run_cmd)
+        jobs = []
+        for relloc in self._getRunLocations(expId, args.subExpId, expConfig, relativeTo=self.outdir):
+            subExpId  = os.path.basename(relloc)
+            subExpDir = join(self.outdir, relloc)
+            if isfile(join(subExpDir, '.mrl.done')) and not args.force: continue
+            cmdParams = self._getCmdParams(expConfig, args, relloc)
+            cmdParams['subExpId'] = subExpId
+            jobs.append(Job(subExpId, subExpDir, template.render(**cmdParams)))
+        if args.dry:
+            return '\n'.join('{}: {}'.format(job.subExpId, job.cmd) for job in jobs)
+        if not jobs:
+            return "All subExps are done, use -f to run them again"
+        hosts = parseHosts(args.hosts) if args.hosts else cfg.run_hosts
+        print "Running {} jobs on {}".format(len(jobs), ', '.join('{} ({} slots)'.format(h, n) for h, n in hosts.items()))
+        with profiler.span('run'):
+            Scheduler(hosts, cfg.run_sshOptions).run(jobs)
+        failed = [job.subExpId for job in jobs if job.exitcode != 0]
+        if not failed and all(subExp.done for subExp in exp):
+            open(join(expDir, '.mrl.done'), 'w').close()
+            exp.invalidate()
+        if failed:
+            return "{} of {} jobs failed: {} (see run.stderr)".format(len(failed), len(jobs), ' '.join(failed))
+        return "All {} jobs succeeded".format(len(jobs))
+
+    def watch(self, args):
+        """ Print status changes of the experiments and re-analyze the ones whose files changed. """
+        from argparse import Namespace
+        from metarunlog.watch import Watcher
+        expDirNames = [self._fmtSingleExp(self._resolveExpId(e)) for e in args.expIds] if args.expIds else \
+                [exp.name for exp in self.experiments() if args.all or not exp.done]
+        def reanalyze(expDirName):
+            if args.noanalyze or not (cfg.analysis_overview or cfg.analysis_subexp): return
+            print "Re-analyzing {}".format(expDirName)
+            try:
+                if int(expDirName) not in self.expList: self._refreshExpList()
+                self.exp(int(expDirName)).invalidate() # watch runs for long, the memoized state is stale
+                self._analyzeKeepCfg(Namespace(expId=str(int(expDirName)), outdir=None, force=None, jobs=args.jobs,
+                    timing=None, pagesize=None, prune=None, lazy=None))
+            except Exception as e:
+                print "Analysis of {} failed: {}: {}".format(expDirName, type(e).__name__, e)
+        watcher = Watcher(self.outdir, expDirNames, cfg.analysis_outdir, self._checkValidExp, reanalyze,
+                args.debounce, args.poll, args.interval)
+        for expDirName in expDirNames:
+            print watcher.statusLine(expDirName)
+        print "Watching {} experiments in {} ({}), ctrl-c to stop".format(len(expDirNames), self.outdir,
+                watcher.notifier.__class__.__name__.lower())
+        watcher.run()
+
+    def serve(self, args):
+        """ Serve the outdir over http, optionally analyzing experiments whose report is missing or stale. """
+        import socket
+        import threading
+        from metarunlog.serve import ReportServer
+        self._analyzeLock = threading.Lock() # analyze changes cfg and the index: one at a time
+        self._expLocks = {} # expDirName -> Lock, for the staleness check of its report
+        self._staleChecks = {} # expDirName -> (time of the check, report mtime then)
+        onRequest = (lambda relpath: self._analyzeIfStale(relpath, args.jobs)) if args.analyze else None
+        server = ReportServer((args.host, args.port), self.outdir, onRequest)
+        print "Serving {} at http://{}:{}/{}, ctrl-c to stop".format(self.outdir, args.host or socket.gethostname(),
+                args.port, ' (analyzing stale reports on request)' if args.analyze else '')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    def _analyzeIfStale(self, relpath, jobs):
+        """ relpath requested from mrl serve: analyze its experiment first if it's a report page older than the subExp files. """
+        import time
+        import threading
+        from argparse import Namespace
+        parts = relpath.split(os.sep)
+        if len(parts) > 3 or len(parts) < 2 or parts[1] != cfg.analysis_outdir or not self._checkValidExp(parts[0]): return
+        if len(parts) == 3 and not parts[2].endswith('.html'): return
+        if not (cfg.analysis_overview or cfg.analysis_subexp): return
+        expDir = join(self.outdir, parts[0])
+        report = join(expDir, cfg.analysis_outdir, cfg.analysis_outfn)
+        reportMtime = lambda: os.stat(report).st_mtime if isfile(report) else None
+        # concurrent requests for the same experiment wait for its check (and analysis), others don't
+        with self._expLocks.setdefault(parts[0], threading.Lock()):
+            checked = self._staleChecks.get(parts[0])
+            if checked and time.time() - checked[0] < cfg.serve_staleCheck and checked[1] == reportMtime(): return
+            t = time.time()
+            if int(parts[0]) not in self.expList: self._refreshExpList()
+            exp = self.exp(int(parts[0]))
+            exp.invalidate()
+            if not exp.subExpIds: return
+            if not (isfile(report) and reportMtime() >= self._lastChange(exp)):
+                print "Report of {} is {}, analyzing".format(parts[0], 'stale' if isfile(report) else 'missing')
+                with self._analyzeLock:
+                    self._analyzeKeepCfg(Namespace(expId=str(exp.expId), outdir=None, force=None, jobs=jobs,
+                        timing=None, pagesize=None, prune=None, lazy=None))
+            self._staleChecks[parts[0]] = (t, reportMtime())
+
+    def _analyzeKeepCfg(self, args):
+        """ analyze(args), then undo the experiment .mrl.cfg overrides that _loadExp set on cfg (watch and serve analyze many). """
+        saved = {k: v for k, v in vars(cfg).items() if not k.startswith('__')}
+        try:
+            return self.analyze(args)
+        finally:
+            for k in [k for k in vars(cfg) if not k.startswith('__') and k not in saved]:
+                delattr(cfg, k)
+            for k, v in saved.items():
+                setattr(cfg, k, v)
+
+    def _lastChange(self, exp):
+        """ Latest mtime of the experiment .mrl, note and the files in its subExp dirs (not recursive). """
+        from metarunlog.watch import ignored
+        mtimes = [os.stat(join(exp.path, fn)).st_mtime for fn in ['.mrl', cfg.note_fn] if isfile(join(exp.path, fn))]
+        for subExp in exp:
+            try:
+                names = listdir(subExp.path)
+            except OSError:
+                continue
+            for name in names:
+                if ignored(name, cfg.analysis_outdir): continue
+                try:
+                    mtimes.append(os.stat(join(subExp.path, name)).st_mtime)
+                except OSError:
+                    pass
+        return max(mtimes) if mtimes else 0
+
+    def du(self, args):
+        """ Disk usage per experiment (and subExp), largest first. """
+        from metarunlog.diskusage import usage, humanSize
+        exps = [self.exp(self._resolveExpId(e)) for e in args.expIds] if args.expIds else self.experiments()
+        with profiler.span('du.scan'):
+            sizes = usage(self.outdir, exps, join(self.outdir, cfg.cacheDir), args.jobs, args.fresh)
+        totals = sorted(((own + sum(subExpSizes.values()), exp) for exp in exps
+            for own, subExpSizes in [sizes[exp.name]]), key=lambda t: -t[0])
+        lines = []
+        for total, exp in totals[:args.top]:
+            desc = exp.conf.get('description') or ''
+            lines.append('{:>10}  {}  {:7s} {}'.format(humanSize(total), exp.name, 'done' if exp.done else '', desc))
+            if args.subexps:
+                own, subExpSizes = sizes[exp.name]
+                for subExpId, size in sorted(subExpSizes.items(), key=lambda t: -t[1])[:args.top]:
+                    lines.append('{:>10}    {}/{}'.format(humanSize(size), exp.name, subExpId))
+                lines.append('{:>10}    {} without subExps'.format(humanSize(own), exp.name))
+        lines.append('{:>10}  total of {} experiments'.format(humanSize(sum(t[0] for t in totals)), len(totals)))
+        return '\n'.join(lines)
+
+    def archive(self, args):
+        """ Pack a done experiment, except its analysis output, into one zip file that mrl keeps reading from. """
+        from metarunlog import archive
+        from metarunlog.diskusage import humanSize
+        expId, expDir, expConfig = self._loadExp(args.expId)
+        exp = self.exp(expId)
+        if args.extract:
+            if not exp.archived:
+                return "Experiment {} is not archived".format(exp.name)
+            with profiler.span('archive.extract'):
+                nFiles = archive.extract(expDir)
+            exp.invalidate()
+            return "Extracted {} files of {}".format(nFiles, exp.name)
+        if exp.archived:
+            return "Experiment {} is already archived".format(exp.name)
+        if not exp.done and not args.force:
+            raise InvalidExpIdException("Experiment {} is not done (no .mrl.done), -f to archive it anyway".format(exp.name))
+        if exp.subExpIds:
+            self._ingestMetrics(expDir, exp.subExpIds, args.jobs) # the metrics store can't grow once archived
+            exp.refreshManifest() # it's trusted as is in the archive
+        with profiler.span('archive.pack'):
+            nFiles, nBytes, size = archive.pack(expDir, [cfg.analysis_outdir])
+        exp.invalidate()
+        return "Archived {} files ({}) of {} into {} ({})".format(nFiles, humanSize(nBytes), exp.name,
+                archive.archiveFn, humanSize(size))
+
+    def _checkNotArchived(self, exp, action):
+        if exp.archived:
+            raise InvalidExpIdException("Experiment {} is archived, mrl archive -extract {} before {}".format(
+                exp.name, exp.expId, action))
+
+    def gc(self, args):
+        """ Prune the checkpoints of done experiments (gc_checkpoints), then remove the blobs nothing links to anymore. """
+        from metarunlog.blobstore import BlobStore
+        msgs = []
+        if cfg.gc_checkpoints:
+            msgs.append(self._gcCheckpoints(args))
+        storeDir = join(self.outdir, cfg.blobDir)
+        if isdir(storeDir) and not args.expIds:
+            with profiler.span('gc.blobs'):
+                removed, freed, kept = BlobStore(storeDir).gc(self.outdir, args.dry)
+            msgs.append("{} {} unreferenced blobs ({:.1f} MB), {} blobs in use".format(
+                    'Would remove' if args.dry else 'Removed', removed, freed / 1e6, kept))
+        elif not cfg.gc_checkpoints:
+            msgs.append("No blob store in {} and no gc_checkpoints in .mrl.cfg".format(storeDir))
+        return '\n'.join(msgs)
+
+    def _gcCheckpoints(self, args):
+        from multiprocessing.pool import ThreadPool
+        from metarunlog.diskusage import checkRules, prunable, humanSize
+        try:
+            checkRules(cfg.gc_checkpoints)
+        except ValueError as e:
+            return str(e)
+        exps = [self.exp(self._resolveExpId(e)) for e in args.expIds] if args.expIds else self.experiments()
+        exps = [exp for exp in exps if exp.done]
+        subExps = [subExp for exp in exps for subExp in exp]
+        pool = ThreadPool(args.jobs)
+        try:
+            with profiler.span('gc.checkpoints'):
+                found = pool.map(lambda subExp: prunable(subExp.path, cfg.gc_checkpoints), subExps, chunksize=1)
+        finally:
+            pool.terminate()
+        nFiles, freed = 0, 0
+        for subExp, files in zip(subExps, found):
+            for rel, size in files:
+                if args.dry:
+                    print "would remove {}".format(join(subExp.exp.name, subExp.subExpId, rel))
+                else:
+                    os.remove(join(subExp.path, rel))
+                nFiles += 1
+                freed += size
+        return "{} {} checkpoints ({}) in {} done experiments".format('Would remove' if args.dry else 'Removed',
+                nFiles, humanSize(freed), len(exps))
+
+    def query(self, args):
+        """ Table of the params (and summary metrics) of the subExps of all experiments, see query.py """
+        from metarunlog import query as mrlquery
+        try:
+            metricSpecs = mrlquery.parseMetricSpecs(args.metric)
+            table = mrlquery.loadTable(self, metricSpecs, args.log, args.jobs)
+            table = mrlquery.query(table, args.where, args.sort, args.top, args.cols)
+        except ValueError as e:
+            return str(e)
+        if args.csv:
+            table.to_csv(sys.stdout if args.csv == '-' else args.csv)
+        else:
+            return table.to_string()
+
+    def ingest(self, args):
+        """ Parse new log lines of all subExps into the metrics store, see metrics.py """
+        expId, expDir, expConfig = self._loadExp(args.expId)
+        if not cfg.metrics:
+            return "No metrics configured in .mrl.cfg"
+        self._checkNotArchived(self.exp(expId), 'ingest')
+        self._ingestMetrics(expDir, self.exp(expId).subExpIds, args.jobs)
+
+    def _ingestMetrics(self, expDir, subExpIds, jobs=1):
+        if not cfg.metrics: return
+        from metarunlog import metrics
+        if any('callback' in spec for spec in cfg.metrics.values()):
+            import mrl_analyze # before forking, so workers find the callbacks
+        nrows = metrics.ingestAll([join(expDir, subExpId) for subExpId in subExpIds], cfg.metrics, jobs)
+        print "Ingested {} new metrics rows from {} subExps".format(nrows, len(subExpIds))
 
     def execWithHooks(self, mode, args):
-        noneFunc   = lambda x:None # empty dummy func
-        hookBefore = getattr(self, 'before_' + args.mode, noneFunc)
-        hookAfter  = getattr(self, 'after_'  + args.mode, noneFunc)
+        hookBefore = getattr(self, 'before_' + args.mode, None)
+        hookAfter  = getattr(self, 'after_'  + args.mode, None)
         # NOTE each hook before/after/func itself has to get expId, expDir from args itself.
-        hookBefore(args)
-        ret = getattr(self, args.mode)(args)
-        hookAfter(args)
+        if hookBefore:
+            with profiler.span('hook:before_' + args.mode, 'hook'):
+                hookBefore(args)
+        with profiler.span('command:' + args.mode, 'command'):
+            ret = getattr(self, args.mode)(args)
+        if hookAfter:
+            with profiler.span('hook:after_' + args.mode, 'hook'):
+                hookAfter(args)
+        self.index.save()
         return ret
 
     def _loadSubExp(self, subExpDir):
-        try:
-            with open(join(subExpDir, '.mrl')) as fh:
-                return json.load(fh, object_hook=_decode_dict)
-        except (IOError, KeyError) as e: # dummy
-            return {'subExpDir': subExpDir, 'params':{}}
-        except ValueError as e:
-            raise type(e)('Failed to load .mrl file for subExp {} \n{}'.format(subExpDir, e.message))
+        return loadDotMrl(subExpDir)
 
     def _getSubExperiments(self, expDir):
         """ returns a list of the existing subexperiments as formatted strings """
-        subexp = []
-        for subdir in sorted(listdir(expDir)):
-            try:
-                if self._fmtSubExp(int(subdir)) == subdir:
-                    subexp.append(str(subdir))
-            except ValueError:
-                pass
-        return subexp
+        return listSubExps(expDir)
 
     def _getRunLocations(self, expId, subExpId, expConfig, relativeTo=''):
         expDir = self._getExpDir(expId)
-        subExpList = self._getSubExperiments(expDir)
+        subExpList = self.exp(expId).subExpIds
         if subExpList:
             if subExpId == 'all':
                 locs = subExpList
@@ -279,8 +684,21 @@ class MetaRunLog:
         return '~/' + relpath(path, expanduser('~'))
 
     def _copyConfigFrom(self, src, dst):
+        from shutil import copy as shcopy
+        blobs = self._blobStore()
         for cfn in cfg.copyFiles:
-            shcopy(join(src,cfn), join(dst, cfn))
+            if blobs: # expDir files get edited, so only share data through a reflink
+                blobs.link(join(src, cfn), join(dst, cfn), 'reflink' if cfg.copyMode == 'reflink' else 'copy')
+            else:
+                shcopy(join(src,cfn), join(dst, cfn))
+
+    def _blobStore(self):
+        """ The BlobStore of the outdir if cfg.blobStore is on, else None. """
+        if not cfg.blobStore: return None
+        if not hasattr(self, 'blobs'):
+            from metarunlog.blobstore import BlobStore
+            self.blobs = BlobStore(join(self.outdir, cfg.blobDir))
+        return self.blobs
 
     def _getCmdParams(self, expConfig, args, relloc):
         """
@@ -301,7 +719,7 @@ class MetaRunLog:
             fh.write("\n")
 
     def _checkValidExp(self, name):
-        if len(name) != len(self._fmtSingleExp(0)): return False
+        if len(name) != self._expNameLen: return False
         try:
             return self._fmtSingleExp(int(name)) == name
         except:
@@ -310,15 +728,17 @@ class MetaRunLog:
     def _loadExp(self, argExpId):
         expId = self._resolveExpId(argExpId)
         expDir = self._getExpDir(expId)
-        expConfig = self._getExpConf(expId)
-        # Load .mrl.cfg file if it exists
+        expConfig = OrderedDict(self.exp(expId).conf)
+        # Load .mrl.cfg file if it exists (also from the archive of an archived experiment)
+        from metarunlog.archive import openFile
         try:
-            with open(join(expDir, '.mrl.cfg')) as fh:
+            with openFile(join(expDir, '.mrl.cfg')) as fh:
                 bconf = json.load(fh, object_hook=_decode_dict)
                 for k,v in bconf.iteritems():
                     setattr(cfg,k,v)
         except IOError: #file doesnt exist -> write a template
-            open(join(expDir, '.mrl.cfg'),'w').write("{\n}\n")
+            if not self.exp(expId).archived:
+                open(join(expDir, '.mrl.cfg'),'w').write("{\n}\n")
         return (expId, expDir, expConfig)
 
     def _resolveExpId(self, expId):
@@ -346,10 +766,22 @@ class MetaRunLog:
             raise InvalidExpIdException("Experiment {} not found.".format(expId))
         return join(self.outdir, self._fmtSingleExp(expId))
 
-    def _newSubExp(self, expDir, subExpId, dotmrl, confContent):
-        subExpDir = join(expDir, self._fmtSubExp(subExpId))
+    def _newSubExp(self, expDir, subExpId, dotmrl, confContent, parentDir=None, copyMode='copy'):
+        """ Make subExp directory under parentDir (default expDir), with copyFiles from expDir. """
+        with profiler.span('makebatch.newSubExp', subExpId=subExpId):
+            self._writeSubExp(expDir, subExpId, dotmrl, confContent, parentDir, copyMode)
+
+    def _writeSubExp(self, expDir, subExpId, dotmrl, confContent, parentDir, copyMode):
+        from metarunlog.util import copyFile
+        subExpDir = join(parentDir or expDir, self._fmtSubExp(subExpId))
         os.mkdir(subExpDir)
-        self._copyConfigFrom(expDir, subExpDir)
+        blobs = self._blobStore()
+        for cfn in cfg.copyFiles:
+            if cfn == cfg.confTemplFile: continue # rendered below
+            if blobs:
+                blobs.link(join(expDir, cfn), join(subExpDir, cfn), copyMode, join(expDir, self._fmtSubExp(subExpId)))
+            else:
+                copyFile(join(expDir, cfn), join(subExpDir, cfn), copyMode)
         with open(join(subExpDir, '.mrl'), 'w') as fh:
             json.dump(dotmrl, fh, indent=2)
             fh.write("\n")
@@ -357,10 +789,33 @@ class MetaRunLog:
             fh.write(confContent)
             fh.write("\n")
     
-    def _getExpConf(self, expId):
-        with open(join(self._getExpDir(expId), '.mrl')) as fh:
-            expConfig = json.JSONDecoder(object_pairs_hook=OrderedDict).decode(fh.read())
-        return expConfig
+    def _swapInSubExps(self, expDir, stagingDir, oldSubExpList, archiveDir=None):
+        """
+        Move the subExps built in stagingDir into expDir, replacing oldSubExpList.
+        The old subExps are first moved aside into stagingDir, on failure everything is rolled back.
+        With archiveDir, the old subExps are moved there instead of being removed.
+        """
+        trashDir = join(stagingDir, '.old')
+        os.mkdir(trashDir)
+        newSubExpList = self._getSubExperiments(stagingDir)
+        moved = [] # (src, dst) renames done so far
+        try:
+            for subExp in oldSubExpList:
+                os.rename(join(expDir, subExp), join(trashDir, subExp))
+                moved.append((join(expDir, subExp), join(trashDir, subExp)))
+            for subExp in newSubExpList:
+                os.rename(join(stagingDir, subExp), join(expDir, subExp))
+                moved.append((join(stagingDir, subExp), join(expDir, subExp)))
+        except OSError:
+            for src, dst in moved[::-1]:
+                os.rename(dst, src)
+            raise
+        if archiveDir and oldSubExpList:
+            os.makedirs(archiveDir)
+            for subExp in oldSubExpList:
+                os.rename(join(trashDir, subExp), join(archiveDir, subExp))
+        elif oldSubExpList:
+            print "Removed subexperiments: {}".format(oldSubExpList)
 
     def _putEmptyNote(self, expDir, description):
         with open(join(expDir, cfg.note_fn),'w') as fh:
@@ -368,12 +823,6 @@ class MetaRunLog:
                 fh.write('### ' + description + '\n')
             fh.write('#### Goal\n\n#### Observations\n\n#### Conclusions\n')
 
-    def _expIsDone(self, expDir):
-        return os.path.exists(os.path.join(expDir, '.mrl.done'))
-
-    def _expIsDoneIndicator(self, expDir):
-        return '   ' if  self._expIsDone(expDir) else '** '
-
 def main():
     try:
         sys.path.append(os.getcwd()) # include modules in basedir like myAnalyze
@@ -402,71 +851,217 @@ def main():
         elif args.mode == 'raise':
             raise
     # No Exception: Resume normal operation.
-    # Extend MetaRunLog with mrl_hooks
+    # Standalone hooks from mrl_hooks. mrl_hooks itself is only imported when a hook is used.
+    hooksAvailable = _findHooksModule()
+    if cfg.hooks and not hooksAvailable:
+        print('Warning: no valid mlr_hooks.py file - will ignore cfg.hooks')
+    hookCommands = [hook for hook in cfg.hooks if hooksAvailable and not
+            ('before_' in hook or 'after_' in hook)]
+    # CL menu. Only the subcommand that is invoked gets its arguments added.
+    commands = [c for c in subcommands if c not in hookCommands] + hookCommands
+    mode = _findMode(sys.argv[1:], commands, ['-trace'])
+    parser = argparse.ArgumentParser(description='Metarunlog.')
+    subparsers = parser.add_subparsers(title='subcommands', description='valid subcommands')
+    for command in commands:
+        if command in hookCommands:
+            parser_cmd = subparsers.add_parser(command, help = 'custom function from mrl_hooks.py')
+            if command == mode: _addHookArgs(parser_cmd, cfg.hooks[command])
+            parser_cmd.set_defaults(mode=command)
+        else:
+            helpstr, addArgs = subcommands[command]
+            parser_cmd = subparsers.add_parser(command, help = helpstr)
+            parser_cmd.set_defaults(mode=command)
+            if command == mode: addArgs(parser_cmd)
+    parser.add_argument('-profile', '--profile', action='store_const', const=True,
+            help='record timing of commands, hooks, analysis functions and I/O steps')
+    parser.add_argument('-trace', default=join(mrlState.outdir, cfg.cacheDir, 'trace.json'),
+            help='path of the -profile trace in chrome trace format, default: outdir/{}/trace.json'.format(cfg.cacheDir))
+    #PARSE
+    args = parser.parse_args()
+    if args.profile or getattr(args, 'timing', None):
+        profiler.enable()
+    if hooksAvailable and (args.mode in hookCommands or any(h in cfg.hooks for h in ['before_' + args.mode, 'after_' + args.mode])):
+        # without mrl_hooks, before_/after_ hooks are ignored (warned above or in _loadHooks), only hook commands can't run
+        if not _loadHooks() and args.mode in hookCommands:
+            return
+    try:
+        ret = mrlState.execWithHooks(args.mode, args)
+        if ret: print(ret)
+        if profiler.enabled:
+            profiler.writeTrace(args.trace)
+            sys.stderr.write(profiler.summaryString() + '\nWrote profile trace to {}\n'.format(args.trace))
+    except (NoCleanStateException,\
+            InvalidExpIdException,\
+            BatchException,\
+            SubExpIdException,\
+            ConfParserException) as e:
+        print(e)
+    except Exception as e:
+        print "Unchecked exception"
+        raise
+
+def _findMode(argv, commands, valueOptions):
+    """
+    The subcommand: the first positional argument, skipping the global options
+    and the values of valueOptions (which argparse also accepts abbreviated).
+    """
+    args = iter(argv)
+    for a in args:
+        if not a.startswith('-'):
+            return a if a in commands else None
+        if '=' not in a and len(a) > 2 and any(o.startswith(a) for o in valueOptions):
+            next(args, None)
+    return None
+
+def _findHooksModule():
+    """ Check if mrl_hooks can be imported, without importing it. """
+    import imp
+    try:
+        fh = imp.find_module('mrl_hooks')[0]
+        if fh: fh.close()
+        return True
+    except ImportError:
+        return False
+
+def _loadHooks():
+    """ Extend MetaRunLog with mrl_hooks """
     try:
         import mrl_hooks # from basedir, user-supplied
         for hook in cfg.hooks:
             setattr(MetaRunLog, hook, getattr(mrl_hooks, hook))
-    except ImportError:
-        if cfg.hooks:
-            print('Warning: no valid mlr_hooks.py file - will ignore cfg.hooks')
-        mrl_hooks = None
-    # CL menu
-    parser = argparse.ArgumentParser(description='Metarunlog.')
-    subparsers = parser.add_subparsers(title='subcommands', description='valid subcommands')
-    # new
-    parser_new = subparsers.add_parser('new', help='new experiment directory.')
+        return True
+    except ImportError as e:
+        print('Warning: no valid mlr_hooks.py file - will ignore cfg.hooks ({})'.format(e))
+        return False
+
+def _addHookArgs(parser_hook, xargs):
+    parser_hook.add_argument('expId', help='experiment ID', default='last', nargs='?')
+    for xarg, defaultval in xargs.iteritems():
+        if defaultval:
+            parser_hook.add_argument('-' + xarg, default=defaultval, help='optional xarg, default: {}'.format(defaultval), nargs='?')
+        else: # named argument, yet required. Slightly bad form.
+            parser_hook.add_argument('-' + xarg, help='required xarg', required=True) #, nargs='?')
+
+def _argsNew(parser_new):
     parser_new.add_argument('-nc', '--notclean', action='store_const', const=True)
     parser_new.add_argument('-gfut', '--gitFailUntracked', choices=['no', 'yes'], default = cfg.gitFailUntrackedDefault)
     parser_new.add_argument('-cp', '--copyConfigFrom', default = 'last', nargs='?')
     parser_new.add_argument('description', help='Description', nargs='?')
-    parser_new.set_defaults(mode='new')
-    # info
-    parser_info = subparsers.add_parser('info', help='show experiment info.')
+
+def _argsInfo(parser_info):
     parser_info.add_argument('expId', default='last', help='exp number, directory, or last', nargs='?')
-    parser_info.set_defaults(mode='info')
-    parser_infosc = subparsers.add_parser('last', help='shortcut for mrl info last.')
+
+def _argsLast(parser_infosc):
     parser_infosc.set_defaults(mode='info', expId='last')
-    # ls
-    parser_ls = subparsers.add_parser('ls', help = 'list output dir, newest first.')
+
+def _argsLs(parser_ls):
     parser_ls.add_argument('-tm', action='store_const', const=True, help='Show timestamp')
     parser_ls.add_argument('-ghash', action='store_const', const=True, help='Show git hash')
     parser_ls.add_argument('-gdesc', action='store_const', const=True, help='Show git description')
     parser_ls.add_argument('-desc', action='store_const', const=True, help='Show experiment description')
-    parser_ls.set_defaults(mode='ls')
-    # makebatch
-    parser_batch = subparsers.add_parser('makebatch', help = 'make batch of config files from batch config template')
+
+def _argsMakebatch(parser_batch):
     parser_batch.add_argument('expId', help='experiment ID', default='last', nargs='?')
     parser_batch.add_argument('-replace', help='Overwrite config files if already expanded', action='store_const', const=True)
-    parser_batch.set_defaults(mode='makebatch')
-    # analyze
-    parser_Analyze = subparsers.add_parser('analyze', help = 'Analyze expId by running the functions from analyze module, specified in .mrl.cfg')
+    parser_batch.add_argument('-j', '--jobs', type=int, default=8, help='number of threads writing subExperiments')
+    parser_batch.add_argument('-link', choices=['copy', 'hardlink', 'reflink', 'symlink'], default=cfg.copyMode,
+            help='how copyFiles (other than confTemplFile) are put in the subExperiments')
+    parser_batch.add_argument('-update', action='store_const', const=True,
+            help='only add the new grid points, keep unchanged subExps and move the ones no longer in the grid to .mrl.removed/')
+    parser_batch.add_argument('-delete', action='store_const', const=True, help='with -update, delete removed subExps instead of moving them')
+    parser_batch.add_argument('-dry', help='Only report the batch size, do not render or write anything', action='store_const', const=True)
+
+def _argsAnalyze(parser_Analyze):
     parser_Analyze.add_argument('expId', help='experiment ID', default='last', nargs='?')
     parser_Analyze.add_argument('-outdir', help='path to output directory, default: expDir/analysis/')
-    parser_Analyze.set_defaults(mode='analyze')
-    # functions registered as standalone hooks
-    if mrl_hooks:
-        for hook in cfg.hooks:
-            if 'before_' in hook or 'after_' in hook:
-                continue
-            parser_hook = subparsers.add_parser(hook, help = 'custom function from mrl_hooks.py')
-            parser_hook.add_argument('expId', help='experiment ID', default='last', nargs='?')
-            for xarg, defaultval in cfg.hooks[hook].iteritems():
-                if defaultval:
-                    parser_hook.add_argument('-' + xarg, default=defaultval, help='optional xarg, default: {}'.format(defaultval), nargs='?')
-                else: # named argument, yet required. Slightly bad form.
-                    parser_hook.add_argument('-' + xarg, help='required xarg', required=True) #, nargs='?')
-            parser_hook.set_defaults(mode=hook)
-    #PARSE
-    args = parser.parse_args()
-    try:
-        ret = mrlState.execWithHooks(args.mode, args)
-        if ret: print(ret)
-    except (NoCleanStateException,\
-            InvalidExpIdException,\
-            BatchException,\
-            ConfParserException) as e:
-        print(e)
-    except Exception as e:
-        print "Unchecked exception"
-        raise
+    parser_Analyze.add_argument('-f', '--force', action='store_const', const=True, help='ignore cached results, re-run all analysis functions')
+    parser_Analyze.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes for the per-subExp analysis functions')
+    parser_Analyze.add_argument('-prune', action='store_const', const=True,
+            help='remove files from the webdir that are no longer in the analysis outdir')
+    parser_Analyze.add_argument('-timing', action='store_const', const=True,
+            help='add a timing table of the analysis to the report (implies -profile)')
+    parser_Analyze.add_argument('-pagesize', type=int,
+            help='split the subExp sections over pages of this many subExps, default: analysis_pageSize in .mrl.cfg')
+    parser_Analyze.add_argument('-lazy', action='store_const', const=True,
+            help='report with thumbnails, bokeh plots initialized when in view and paginated big tables, default: analysis_lazy in .mrl.cfg')
+
+def _argsPublish(parser_publish):
+    parser_publish.add_argument('expId', help='experiment ID', default='last', nargs='?')
+    parser_publish.add_argument('-outdir', help='path to analysis output directory, default: expDir/analysis/')
+    parser_publish.add_argument('-prune', action='store_const', const=True,
+            help='remove files from the webdir that are no longer in the analysis outdir')
+
+def _argsRun(parser_run):
+    parser_run.add_argument('expId', help='experiment ID', default='last', nargs='?')
+    parser_run.add_argument('-subExpId', default='all', help='subExpId to run, default: all')
+    parser_run.add_argument('-hosts', help='comma separated host:slots, default: run_hosts in .mrl.cfg')
+    parser_run.add_argument('-cmd', help='command template, default: run_cmd in .mrl.cfg')
+    parser_run.add_argument('-f', '--force', action='store_const', const=True, help='also run subExps that are done')
+    parser_run.add_argument('-dry', action='store_const', const=True, help='only print the commands')
+
+def _argsWatch(parser_watch):
+    parser_watch.add_argument('expIds', nargs='*', help='experiment IDs, default: all experiments that are not done')
+    parser_watch.add_argument('-all', action='store_const', const=True, help='also watch experiments that are done')
+    parser_watch.add_argument('-debounce', type=float, default=30., help='seconds without changes before re-analysis, default: 30')
+    parser_watch.add_argument('-noanalyze', action='store_const', const=True, help='only report status, no re-analysis')
+    parser_watch.add_argument('-j', '--jobs', type=int, default=1, help='processes for the re-analysis')
+    parser_watch.add_argument('-poll', action='store_const', const=True, help='poll instead of inotify (automatic on NFS)')
+    parser_watch.add_argument('-interval', type=float, default=10., help='seconds between polls, default: 10')
+
+def _argsServe(parser_serve):
+    parser_serve.add_argument('-port', type=int, default=8800, help='default: 8800')
+    parser_serve.add_argument('-host', default='', help='address to bind, default: all interfaces')
+    parser_serve.add_argument('-analyze', action='store_const', const=True,
+            help='run analyze for an experiment when its report is requested and missing or older than its subExp files')
+    parser_serve.add_argument('-j', '--jobs', type=int, default=1, help='processes for the on-demand analysis')
+
+def _argsArchive(parser_archive):
+    parser_archive.add_argument('expId', help='experiment ID', default='last', nargs='?')
+    parser_archive.add_argument('-extract', action='store_const', const=True, help='unpack an archived experiment again')
+    parser_archive.add_argument('-f', '--force', action='store_const', const=True, help='also archive an experiment that is not done')
+    parser_archive.add_argument('-j', '--jobs', type=int, default=1, help='processes for the metrics ingest before packing')
+
+def _argsDu(parser_du):
+    parser_du.add_argument('expIds', nargs='*', help='experiment IDs, default: all')
+    parser_du.add_argument('-subexps', action='store_const', const=True, help='also show the size of each subExp')
+    parser_du.add_argument('-top', type=int, help='only show the TOP largest experiments (and subExps)')
+    parser_du.add_argument('-fresh', action='store_const', const=True, help='ignore the cached sizes of done experiments')
+    parser_du.add_argument('-j', '--jobs', type=int, default=16, help='number of scanning threads')
+
+def _argsGc(parser_gc):
+    parser_gc.add_argument('expIds', nargs='*', help='only prune checkpoints of these experiments (no blob gc), default: all done ones')
+    parser_gc.add_argument('-dry', action='store_const', const=True, help='only report what would be removed')
+    parser_gc.add_argument('-j', '--jobs', type=int, default=16, help='number of scanning threads')
+
+def _argsIngest(parser_ingest):
+    parser_ingest.add_argument('expId', help='experiment ID', default='last', nargs='?')
+    parser_ingest.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+
+def _argsQuery(parser_query):
+    parser_query.add_argument('-where', help='pandas query expression, eg "lr < 0.05 and loss_min < 1.2"')
+    parser_query.add_argument('-sort', help='comma separated columns to sort on, col:desc for descending')
+    parser_query.add_argument('-top', type=int, help='only show the first TOP rows')
+    parser_query.add_argument('-cols', help='comma separated columns to show')
+    parser_query.add_argument('-metric', action='append', help='summary metric column:agg[,agg], agg in min,max,first,last,mean,count. Repeatable.')
+    parser_query.add_argument('-log', help='log of the metrics store to summarize, default: first in cfg.metrics')
+    parser_query.add_argument('-csv', nargs='?', const='-', help='output as csv, to file or stdout (-)')
+    parser_query.add_argument('-j', '--jobs', type=int, default=8, help='number of worker processes for loading')
+
+# subcommand: (help, function adding its arguments to the subparser)
+subcommands = OrderedDict([
+    ('new',       ('new experiment directory.', _argsNew)),
+    ('info',      ('show experiment info.', _argsInfo)),
+    ('last',      ('shortcut for mrl info last.', _argsLast)),
+    ('ls',        ('list output dir, newest first.', _argsLs)),
+    ('makebatch', ('make batch of config files from batch config template', _argsMakebatch)),
+    ('analyze',   ('Analyze expId by running the functions from analyze module, specified in .mrl.cfg', _argsAnalyze)),
+    ('run',       ('run the subExps of expId with a job queue (overridden by a run hook)', _argsRun)),
+    ('watch',     ('report finished subExps and re-analyze experiments as their files change', _argsWatch)),
+    ('serve',     ('serve the outdir over http with compression and caching headers', _argsServe)),
+    ('publish',   ('copy the changed analysis output of expId to analysis_webdir', _argsPublish)),
+    ('archive',   ('pack a done experiment into one zip file, still readable by mrl', _argsArchive)),
+    ('du',        ('disk usage per experiment and subExp, cached for done experiments', _argsDu)),
+    ('gc',        ('prune checkpoints of done experiments and remove unreferenced blobs', _argsGc)),
+    ('query',     ('query the params and metrics of all subExps of all experiments', _argsQuery)),
+    ('ingest',    ('parse new lines of the subExp logs into the metrics store, as configured in .mrl.cfg', _argsIngest)),
+])
@@ -0,0 +1,156 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Runs the per-subExp mrl_analyze functions, serially or fanned out to a process pool,
+# and caches their return values so unchanged subExps are not re-analyzed.
+
+import os
+from os.path import join, isdir, isfile, relpath
+import traceback
+import itertools
+import cPickle as pickle
+from metarunlog import profiler
+
+# rtypes for which rdata refers to files emitted into the analysis outdir.
+fileRtypes = ['plot', 'mp4', 'plotlinkbokeh']
+
+class AnalysisCache:
+    """
+    Pickled return values of analysis functions, one file per (subExpId, funcname).
+    An entry is valid if it was produced by the same funcname and extra args
+    and the same mrl_analyze source, the files in the subExp dir have the same mtimes and sizes,
+    and the files it emitted in the analysis outdir still exist.
+    """
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self._stats   = {} # subExpDir -> file stats, shared by all funcs of a subExp
+        self._moduleHash = self._hashModule()
+        if not isdir(cacheDir): os.makedirs(cacheDir)
+
+    @staticmethod
+    def _hashModule():
+        """ sha1 of the source of the loaded mrl_analyze module, None if it isn't loaded. """
+        import sys
+        import hashlib
+        module = sys.modules.get('mrl_analyze')
+        fn = getattr(module, '__file__', None)
+        if not fn: return None
+        if fn.endswith(('.pyc', '.pyo')): fn = fn[:-1]
+        try:
+            with open(fn, 'rb') as fh:
+                return hashlib.sha1(fh.read()).hexdigest()
+        except IOError:
+            return None
+
+    def _fn(self, subExpId, funcname):
+        return join(self.cacheDir, '{}.{}.pkl'.format(subExpId, funcname))
+
+    def key(self, call):
+        subExpId, funcname, fargs = call
+        subExpDir, xtrargs = fargs[0], fargs[4:]
+        if subExpDir not in self._stats:
+            stats = []
+            for dirpath, dirnames, filenames in os.walk(subExpDir):
+                dirnames.sort()
+                for fn in sorted(filenames):
+                    st = os.stat(join(dirpath, fn))
+                    stats.append((relpath(join(dirpath, fn), subExpDir), st.st_size, st.st_mtime))
+            self._stats[subExpDir] = stats
+        return (funcname, repr(xtrargs), self._moduleHash, self._stats[subExpDir])
+
+    def get(self, call, key):
+        """ Returns the cached result tuple as runAnalysisFunc would, or None. """
+        subExpId, funcname, fargs = call
+        try:
+            with open(self._fn(subExpId, funcname), 'rb') as fh:
+                cachedKey, retval = pickle.load(fh)
+        except Exception:
+            return None
+        if cachedKey != key: return None
+        outdir = fargs[1]
+        if not all(isfile(join(outdir, fn)) for fn in emittedFiles(retval)): return None
+        return (subExpId, funcname, retval, None)
+
+    def put(self, call, key, retval):
+        subExpId, funcname, fargs = call
+        fn = self._fn(subExpId, funcname)
+        tmpfn = '{}.{}.tmp'.format(fn, os.getpid())
+        try:
+            with open(tmpfn, 'wb') as fh:
+                pickle.dump((key, retval), fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmpfn, fn)
+        except Exception as e: # eg unpicklable return value, just don't cache it.
+            if os.path.exists(tmpfn): os.remove(tmpfn)
+            print("Not caching {} for subExp {}: {}".format(funcname, subExpId, e))
+
+def emittedFiles(retval):
+    """ Filenames (relative to the analysis outdir) referred to by an analysis return value. """
+    files = []
+    for (rdata, rtype, rheader) in (retval or []):
+        if rtype in fileRtypes:
+            files += [rdata] if isinstance(rdata, basestring) else list(rdata)
+    return files
+
+def runAnalysisFunc(call):
+    """
+    Call mrl_analyze.funcname(*fargs) for call = (subExpId, funcname, fargs).
+    Module-level so it can be pickled to a worker process.
+    Returns (subExpId, funcname, retval, err, timing) with err a traceback string or None,
+    and timing measured in the worker when profiling (see profiler.timed).
+    """
+    subExpId, funcname, fargs = call
+    try:
+        import mrl_analyze # from basedir, user-supplied. Cached in sys.modules after fork.
+        retval, timing = profiler.timed(getattr(mrl_analyze, funcname), *fargs)
+    except Exception:
+        return (subExpId, funcname, None, traceback.format_exc(), None)
+    import multiprocessing
+    if multiprocessing.current_process().name != 'MainProcess': # in a pool worker, the result is pickled back
+        try:
+            pickle.dumps(retval, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return (subExpId, funcname, None, 'Return value can not be sent back from the worker process, '
+                    'return picklable values when using -j > 1:\n' + traceback.format_exc(), None)
+    return (subExpId, funcname, retval, None, timing)
+
+def runAnalysisCalls(calls, jobs=1, cache=None, force=False):
+    """
+    Generator over the (subExpId, funcname, retval, err) results of runAnalysisFunc for each call, in the order of calls.
+    With jobs > 1 the calls are executed in a multiprocessing pool;
+    the return values of the analysis functions then need to be picklable.
+    With a cache, calls with a valid cache entry are replayed instead of executed
+    (unless force), and the fresh results are stored.
+    """
+    keys = [cache.key(call) if cache else None for call in calls]
+    hits = [cache.get(call, key) if cache and not force else None for call, key in zip(calls, keys)]
+    misses = [call for call, hit in zip(calls, hits) if hit is None]
+    if cache and not force:
+        print("Reusing cached results for {} of {} analysis calls".format(len(calls) - len(misses), len(calls)))
+    results = _execCalls(misses, jobs)
+    for call, key, hit in zip(calls, keys, hits):
+        if hit is not None:
+            yield hit
+            continue
+        subExpId, funcname, retval, err, timing = next(results)
+        if timing:
+            profiler.record('analysis:' + funcname, timing['t0'], timing['wall'], timing['cpu'],
+                    'analysis', timing['pid'], timing['tid'], {'subExpId': subExpId})
+        if cache and not err:
+            cache.put(call, key, retval)
+        yield (subExpId, funcname, retval, err)
+
+def _execCalls(calls, jobs):
+    if jobs <= 1 or not calls:
+        for res in itertools.imap(runAnalysisFunc, calls):
+            yield res
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for res in pool.imap(runAnalysisFunc, calls):
+            yield res
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,189 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Archived experiments for mrl archive: everything in a done expDir except the analysis output is packed
+# into expDir/.mrl.archive.zip, so thousands of small files become one. The zip central directory gives
+# random access, and the functions below (openFile, isfile, isdir, listdir, memmap) read a path inside an
+# archived expDir from the zip when it's not on disk. mrl itself reads .mrl files, the manifest, notes and
+# the metrics store through them; analysis functions can use openFile instead of open for their logs.
+# Metrics columns (.f8) and already compressed files are stored uncompressed, so they can be memory-mapped.
+
+import os
+import time
+import errno
+import struct
+import zipfile
+import threading
+from os.path import join, isfile as _isfile, isdir as _isdir, dirname, abspath, relpath
+
+archiveFn = '.mrl.archive.zip'
+storedExts = ['.f8', '.png', '.jpg', '.jpeg', '.gif', '.mp4', '.gz', '.bz2', '.xz', '.zip', '.npz', '.h5']
+
+class Archive:
+    """ Read access to an archive, by paths relative to the archived expDir ('' is the expDir itself). """
+    def __init__(self, fn):
+        self.fn = fn
+        self.zf = zipfile.ZipFile(fn) # opened from a filename, every open() gets its own file handle
+        self.infos = {}
+        self.dirs = {'': set()} # relative dir -> names in it
+        for info in self.zf.infolist():
+            name = info.filename.rstrip('/')
+            if not info.filename.endswith('/'):
+                self.infos[name] = info
+            parts = name.split('/')
+            for i in range(len(parts)):
+                self.dirs.setdefault('/'.join(parts[:i]), set()).add(parts[i])
+            if info.filename.endswith('/'):
+                self.dirs.setdefault(name, set())
+
+    def isfile(self, rel):
+        return rel in self.infos
+
+    def isdir(self, rel):
+        return rel in self.dirs
+
+    def listdir(self, rel):
+        return sorted(self.dirs[rel])
+
+    def open(self, rel):
+        return self.zf.open(self.infos[rel])
+
+    def stat(self, rel):
+        """ (size, mtime) of a member, mtime at the 2 s resolution of zip. """
+        info = self.infos[rel]
+        return info.file_size, time.mktime(info.date_time + (0, 0, -1))
+
+    def dataOffset(self, rel):
+        """ Offset of the data of a stored (uncompressed) member in the zip file. """
+        info = self.infos[rel]
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise IOError("{} is compressed in {}".format(rel, self.fn))
+        with open(self.fn, 'rb') as fh:
+            fh.seek(info.header_offset)
+            header = fh.read(30)
+        nameLen, extraLen = struct.unpack('<HH', header[26:30])
+        return info.header_offset + 30 + nameLen + extraLen
+
+_archives = {} # zip path -> ((mtime, size), Archive)
+_lock = threading.Lock()
+
+def get(fn):
+    """ Archive of zip file fn, kept open while the file is unchanged. """
+    st = os.stat(fn)
+    with _lock:
+        cached = _archives.get(fn)
+        if cached is None or cached[0] != (st.st_mtime, st.st_size):
+            cached = _archives[fn] = ((st.st_mtime, st.st_size), Archive(fn))
+        return cached[1]
+
+def locate(path):
+    """ (Archive, path relative to the archived expDir) for a path in an archived expDir, or None. """
+    path = abspath(path)
+    d = path
+    while True:
+        if _isfile(join(d, archiveFn)):
+            rel = relpath(path, d)
+            return get(join(d, archiveFn)), '' if rel == os.curdir else rel.replace(os.sep, '/')
+        if dirname(d) == d:
+            return None
+        d = dirname(d)
+
+def openFile(path, mode='r'):
+    """ open(path, mode), or for reading, the member of the archive path is in. """
+    try:
+        return open(path, mode)
+    except IOError as e:
+        if e.errno != errno.ENOENT or mode.strip('rbU'):
+            raise
+        loc = locate(path)
+        if loc is None or not loc[0].isfile(loc[1]):
+            raise
+        return loc[0].open(loc[1])
+
+def isfile(path):
+    if _isfile(path): return True
+    loc = locate(path)
+    return loc is not None and loc[0].isfile(loc[1])
+
+def isdir(path):
+    if _isdir(path): return True
+    loc = locate(path)
+    return loc is not None and loc[0].isdir(loc[1])
+
+def listdir(path):
+    """ Names in path on disk and, in an archived expDir, in the archive. """
+    onDisk = _isdir(path)
+    names = set(os.listdir(path)) if onDisk else set()
+    if archiveFn in names or not onDisk:
+        loc = locate(path)
+        if loc is not None and loc[0].isdir(loc[1]):
+            names.update(loc[0].listdir(loc[1]))
+        elif not onDisk:
+            raise OSError(errno.ENOENT, 'No such file or directory', path)
+    return sorted(names)
+
+def memmap(path, dtype, shape):
+    """ Read-only numpy memmap of path, from the archive if it's not on disk. """
+    import numpy as np
+    if _isfile(path):
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+    loc = locate(path)
+    if loc is None or not loc[0].isfile(loc[1]):
+        raise IOError(errno.ENOENT, 'No such file', path)
+    return np.memmap(loc[0].fn, dtype=dtype, mode='r', offset=loc[0].dataOffset(loc[1]), shape=shape)
+
+def pack(expDir, skip=()):
+    """
+    Move everything in expDir except the top-level names in skip into expDir/archiveFn.
+    The archive is written to a temp file and verified before anything is removed.
+    Returns (number of files, bytes before compression, archive size).
+    """
+    import shutil
+    fn = join(expDir, archiveFn)
+    tmpfn = fn + '.tmp'
+    top = [name for name in sorted(os.listdir(expDir)) if name not in skip and name not in (archiveFn, os.path.basename(tmpfn))]
+    nFiles, nBytes = 0, 0
+    zf = zipfile.ZipFile(tmpfn, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+    try:
+        for name in top:
+            path = join(expDir, name)
+            walk = os.walk(path) if _isdir(path) else [(expDir, [], [name])]
+            for dirpath, dirnames, filenames in walk:
+                dirnames.sort()
+                if dirpath != expDir:
+                    zf.write(dirpath, relpath(dirpath, expDir).replace(os.sep, '/') + '/') # keeps empty dirs
+                for f in sorted(filenames):
+                    rel = relpath(join(dirpath, f), expDir).replace(os.sep, '/')
+                    stored = os.path.splitext(f)[1].lower() in storedExts
+                    zf.write(join(dirpath, f), rel, zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+                    nFiles += 1
+                    nBytes += os.path.getsize(join(dirpath, f))
+    finally:
+        zf.close()
+    bad = zipfile.ZipFile(tmpfn).testzip()
+    if bad is not None:
+        os.remove(tmpfn)
+        raise IOError("Archive of {} is corrupt at {}, nothing removed".format(expDir, bad))
+    os.rename(tmpfn, fn)
+    for name in top:
+        path = join(expDir, name)
+        if _isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    return nFiles, nBytes, os.path.getsize(fn)
+
+def extract(expDir):
+    """ Restore the files of expDir/archiveFn (with their modes and mtimes), then remove the archive. Returns the number of files. """
+    fn = join(expDir, archiveFn)
+    zf = zipfile.ZipFile(fn)
+    infos = zf.infolist()
+    zf.extractall(expDir)
+    zf.close()
+    for info in sorted(infos, key=lambda info: -len(info.filename)): # dirs after their contents
+        path = join(expDir, info.filename.rstrip('/'))
+        mode = info.external_attr >> 16
+        if mode & 0o7777: os.chmod(path, mode & 0o7777)
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(path, (mtime, mtime))
+    os.remove(fn)
+    return len([info for info in infos if not info.filename.endswith('/')])
@@ -0,0 +1,123 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Content-addressed store of the copyFiles under outdir/.mrl.blobs: every distinct file content
+# is stored once, read-only, as blobs/ab/cdef.. (sha1), and linked into the experiment and subExp dirs
+# with a hardlink, a relative symlink or a reflink. gc removes the blobs nothing refers to anymore.
+
+import os
+import stat
+import hashlib
+import threading
+from os.path import join, isdir, isfile, islink, dirname, relpath, realpath
+
+blobModes = ['hardlink', 'symlink', 'reflink', 'copy']
+
+def fileSha(fn):
+    h = hashlib.sha1()
+    with open(fn, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), ''):
+            h.update(block)
+    return h.hexdigest()
+
+class BlobStore:
+    """
+    Blobs have a link count of 1 when no hardlink refers to them.
+    Symlinks are only found by scanning the outdir, so gc does that scan only once a symlink was made
+    (marked by the file 'symlinked' in the store).
+    """
+    def __init__(self, storeDir):
+        self.storeDir = storeDir
+        self._hashes = {} # (path, size, mtime, ino) -> sha, files are hashed once per process
+        self._lock = threading.Lock()
+
+    def blobPath(self, sha):
+        return join(self.storeDir, sha[:2], sha[2:])
+
+    def put(self, src):
+        """ Store the content of src (if not stored yet), returns the blob path. """
+        st = os.stat(src)
+        key = (src, st.st_size, st.st_mtime, st.st_ino)
+        with self._lock:
+            sha = self._hashes.get(key)
+        if sha is None:
+            sha = fileSha(src)
+            with self._lock:
+                self._hashes[key] = sha
+        blob = self.blobPath(sha)
+        if not isfile(blob):
+            import shutil
+            if not isdir(dirname(blob)):
+                try:
+                    os.makedirs(dirname(blob))
+                except OSError: # made by another thread
+                    if not isdir(dirname(blob)): raise
+            tmpfn = '{}.{}.{}.tmp'.format(blob, os.getpid(), threading.current_thread().ident)
+            shutil.copy(src, tmpfn)
+            # read-only, so a blob can't be changed in place through one of its links
+            os.chmod(tmpfn, stat.S_IMODE(os.stat(tmpfn).st_mode) & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+            try:
+                os.link(tmpfn, blob) # unlike rename, never replaces a blob another thread just stored and linked
+            except OSError:
+                if not isfile(blob): raise
+            finally:
+                os.remove(tmpfn)
+        return blob
+
+    def link(self, src, dst, mode='hardlink', linkDir=None):
+        """
+        Put the content of src at dst through the store. linkDir is the directory dst will finally be in
+        (if it's moved after linking), symlinks are relative to it so the outdir can be moved.
+        Falls back to a regular copy of the blob if the filesystem can't link.
+        """
+        from metarunlog.util import copyFile
+        blob = self.put(src)
+        if mode == 'symlink':
+            if not isfile(join(self.storeDir, 'symlinked')):
+                open(join(self.storeDir, 'symlinked'), 'w').close()
+            os.symlink(relpath(blob, linkDir or dirname(dst)), dst)
+            return
+        if mode not in blobModes:
+            raise ValueError("Unknown link mode {}".format(mode))
+        copyFile(blob, dst, mode) # a hardlink past the max link count also ends up as a copy
+        if mode != 'hardlink' or os.stat(dst).st_nlink == 1:
+            os.chmod(dst, stat.S_IMODE(os.stat(src).st_mode)) # copies are regular, writable files again
+
+    def blobs(self):
+        """ Yield (sha, path) of all blobs. """
+        if not isdir(self.storeDir): return
+        for prefix in sorted(os.listdir(self.storeDir)):
+            if len(prefix) != 2 or not isdir(join(self.storeDir, prefix)): continue
+            for rest in os.listdir(join(self.storeDir, prefix)):
+                if not rest.endswith('.tmp'):
+                    yield prefix + rest, join(self.storeDir, prefix, rest)
+
+    def symlinkedBlobs(self, outdir):
+        """ Real paths of the blobs that symlinks under outdir point to. """
+        refs = set()
+        storeDir = realpath(self.storeDir)
+        for dirpath, dirnames, filenames in os.walk(outdir):
+            if realpath(dirpath) == storeDir:
+                dirnames[:] = []
+                continue
+            for fn in filenames:
+                path = join(dirpath, fn)
+                if islink(path):
+                    target = realpath(path)
+                    if target.startswith(storeDir + os.sep): refs.add(target)
+        return refs
+
+    def gc(self, outdir, dry=False):
+        """ Remove unreferenced blobs, returns (number removed, bytes freed, number kept). """
+        symlinked = self.symlinkedBlobs(outdir) if isfile(join(self.storeDir, 'symlinked')) else set()
+        removed, freed, kept = 0, 0, 0
+        for sha, path in self.blobs():
+            st = os.stat(path)
+            if st.st_nlink > 1 or realpath(path) in symlinked:
+                kept += 1
+                continue
+            removed += 1
+            freed += st.st_size
+            if not dry: os.remove(path)
+        if not symlinked and not dry and isfile(join(self.storeDir, 'symlinked')):
+            os.remove(join(self.storeDir, 'symlinked')) # no symlinks left, next gc can skip the scan
+        return removed, freed, kept
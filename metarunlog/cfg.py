@@ -10,6 +10,11 @@ subExpFormat    = '{subExpId:03d}'
 gitFailUntrackedDefault= 'no'
 copyFiles       = ['conf.lua']
 confTemplFile   = 'conf.lua' # what file is expanded into template with makebatch()
+copyMode        = 'copy' # makebatch: 'copy', 'hardlink' or 'reflink' the copyFiles into subExps ('symlink' needs blobStore)
+blobStore       = False # store copyFiles once per content in outdir/blobDir, and link them into exps and subExps with copyMode
+blobDir         = '.mrl.blobs' # relative to outdir
+gc_checkpoints  = [] # mrl gc in done exps: [{'pattern': 'model_*.t7', 'last': 1, 'best': 2, 'score': 'loss([0-9.]+)', 'order': 'min'}]
+manifestCheck   = 'stat' # trust expDir/.mrl.manifest if 'stat': size/mtime of every subExp .mrl match, 'ids': the subExp ids match
 giturl          = 'git@github.rtp.raleigh.ibm.com:multimodal/multilingconv.git'
 analysis_overview = { # {funcname: ('extra_arg1', extrarg2, ), .. }
     'bestPerf': (),
@@ -17,9 +22,21 @@ analysis_overview = { # {funcname: ('extra_arg1', extrarg2, ), .. }
 analysis_subexp = {
     'plotSinglePerf': (),
 }
+metrics = {} # {logfn: {'regex': '..(?P<col>..)..'} or {'callback': 'funcname'}}, see metrics.py
 analysis_outdir = 'analysis' # relative to expDir
 analysis_outfn  = 'index.html' # inside analysis_outdir
+analysis_pageSize = None # number of subExps per report page, None: single page
+analysis_lazy = False # report with thumbnails, lazily initialized bokeh plots and paginated JSON tables (analyze -lazy)
+analysis_thumbWidth = 400 # lazy reports: width of the plot thumbnails
+analysis_tableRows = 100 # lazy reports: tables with more rows are loaded from JSON, this many rows per page
+analysis_maxPoints = 2000 # points per series in renderHtml.bokehLines plots, longer series are downsampled
+analysis_downsample = 'lttb' # or 'minmax': min and max per bucket
 analysis_webdir = '/u/tsercu/www'
+analysis_webPrune = False # remove files from webdir that are gone from analysis_outdir
+serve_staleCheck = 10 # mrl serve -analyze: seconds a report stays trusted after its subExp files were checked
+run_cmd = 'cd {{absloc}} && luajit ../code/go.lua -conf {{confTemplFile}}' # mrl run: jinja template, per subExp
+run_hosts = {'localhost': 1} # {host: number of concurrent jobs}, localhost runs without ssh
+run_sshOptions = '-o ControlMaster=auto -o ControlPath=~/.ssh/mrl-%r@%h:%p -o ControlPersist=10m'
 hooks = {
     'after_new' : {},
     'after_makebatch' : {},
@@ -27,3 +44,4 @@ hooks = {
     'score'     : {'epoch':None, 'langid':'swb', 'testset':'hub5','gammaN': 1, 'gammas': '{"0.8"}', 'acwtfrom': 1, 'acwtto': 3, 'subExps':'all'}
 }
 note_fn = '.mrl.note'
+cacheDir = '.mrl.cache' # relative to outdir (experiment index) and to analysis_outdir (analysis cache)
@@ -1,49 +1,224 @@
 # Metarunlog, experiment management tool.
 # Author: Tom Sercu
 # Date: 2016-10-07
+import os
+import math
+import random
+import jinja2
 from jinja2 import Template
 from collections import OrderedDict
 import itertools
+import hashlib
 import cfg
+from metarunlog import profiler
+from metarunlog.exceptions import ConfParserException
 
 class ConfParser:
     """
-    ConfParser class will take a template experiment config file, 
-    which ends with MRL:grid[] or MRL:params instructions and allow
+    ConfParser class will take a template experiment config file,
+    which ends with MRL:grid[], MRL:params or MRL:sample[] instructions and allow
     easy expansion into real experiment config files.
+    Sampled expansion: MRL:sample['lr'] = loguniform(1e-4, 1e-1) (also uniform, randint, choice),
+    MRL:budget = 32 samples, drawn by MRL:sampler = 'random' (default), 'lhs' or 'sobol' with MRL:seed = 0 (default).
+    Every sample is combined with every point of params x grid.
     It is initialized with experiment config template (list of lines)
-    including the last lines determining the values,
-    and generates self.output as a list of strings (to be written to file).
+    including the last lines determining the values.
+    The expansion is lazy: iterParams() and iterOutput() generate the batch
+    one subExp at a time, len() gives the batch size without rendering.
+    With cacheDir, the compiled template is cached there (jinja2 bytecode cache).
+    bodyHash identifies the template without its MRL lines: if it is unchanged,
+    a subExp with the same params renders the same config.
     """
-    def __init__(self, templatefile):
+    def __init__(self, templatefile, cacheDir=None):
+        with open(templatefile) as fh:
+            self.template = fh.readlines()
         try:
-            with open(templatefile) as fh:
-                self.template = fh.readlines()
+            if cacheDir:
+                if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+                env = jinja2.Environment(loader=jinja2.DictLoader({templatefile: "".join(self.template)}),
+                        bytecode_cache=jinja2.FileSystemBytecodeCache(cacheDir))
+                self.jtmpl = env.get_template(templatefile)
+            else:
+                self.jtmpl = Template("".join(self.template))
         except jinja2.exceptions.TemplateSyntaxError as e:
             err = "TemplateSyntaxError in your {} template file: \n {}".format(cfg.confTemplFile, str(e))
             raise ConfParserException(err)
-        self.jtmpl = Template("".join(self.template))
-        grid = OrderedDict()
-        params = [{}]
+        # MRL lines see the module globals (math, random, itertools, ...) as before, plus these names
+        ns = dict(globals(), grid=OrderedDict(), params=[{}], sample={}, budget=None, sampler='random', seed=0)
         # iterate over last lines and parse them to collect grid parameters.
         # correct formatting of mrl instructions:
         # [something] MRL:grid['key'] = [vallist]
         # where [something] is comment symbol. The space after it is essential.
-        for line in self.template[::-1]:
-            if not line.strip(): continue
+        nBody = len(self.template)
+        for j in range(len(self.template)-1, -1, -1):
+            line = self.template[j]
+            if not line.strip():
+                nBody = j
+                continue
             line = line.split(None, 1)[-1].split(":",1) #discard comment symbol
             if line[0] != 'MRL': break
-            exec(line[1]) #add to grid / params
-        # construct output params list
-        keys = grid.keys()
-        vals = list(itertools.product(*[grid[k] for k in keys]))
-        self.params = [dict(zip(keys, v)) for v in vals]
-        self.params = [dict(d1.items() + d2.items()) for d1,d2 in itertools.product(params, self.params)]
-        self.output = []
-        for i, param in enumerate(self.params):
+            try:
+                exec(line[1], ns) #add to grid / params / sample
+            except Exception as e:
+                raise ConfParserException("Error in MRL instruction '{}': {}: {}".format(line[1].strip(), type(e).__name__, e))
+            nBody = j
+        self.bodyHash = hashlib.sha1("".join(self.template[:nBody])).hexdigest()
+        self.grid = ns['grid']
+        self.paramList = ns['params']
+        self.samples = self._drawSamples(ns['sample'], ns['budget'], ns['sampler'], ns['seed'])
+
+    def _drawSamples(self, sample, budget, sampler, seed):
+        """ List of budget dicts {key: value} for the sampled keys, [{}] without MRL:sample. """
+        if not sample:
+            if budget is not None:
+                raise ConfParserException("MRL:budget without MRL:sample instructions")
+            return [{}]
+        if not isinstance(budget, int) or budget < 1:
+            raise ConfParserException("MRL:sample needs MRL:budget = number of samples, got {!r}".format(budget))
+        if sampler not in samplers:
+            raise ConfParserException("Unknown MRL:sampler {!r}, choose from {}".format(sampler, sorted(samplers)))
+        overlap = set(sample) & (set(self.grid) | set(k for d in self.paramList for k in d))
+        if overlap:
+            raise ConfParserException("Keys both sampled and in grid / params: {}".format(sorted(overlap)))
+        keys = sorted(sample) # dimension order independent of the order of the MRL lines
+        for key in keys:
+            if not hasattr(sample[key], 'fromUnit'):
+                raise ConfParserException("MRL:sample['{}'] should be uniform, loguniform, randint or choice".format(key))
+        points = samplers[sampler](budget, len(keys), seed)
+        return [dict((key, sample[key].fromUnit(u)) for key, u in zip(keys, point)) for point in points]
+
+    def __len__(self):
+        """ Batch size, without expanding the grid. """
+        n = len(self.paramList) * len(self.samples)
+        for vals in self.grid.values():
+            n *= len(vals)
+        return n
+
+    def iterParams(self):
+        """ Generate (i, params) for each point of params x grid x samples, i starting from 1. """
+        keys = self.grid.keys()
+        # one flat product: a nested product as argument would be materialized into a tuple first
+        for i, point in enumerate(itertools.product(self.paramList, *[self.grid[k] for k in keys] + [self.samples])):
+            d1, vals, d2 = point[0], point[1:-1], point[-1]
+            param = dict(d1.items() + zip(keys, vals) + d2.items())
             param['subExpId'] = cfg.subExpFormat.format(subExpId=i+1)
-            self.output.append((i+1, param, self.renderFromParams(param)))
+            yield (i+1, param)
+
+    def iterOutput(self):
+        """ Generate (i, params, fileContent) for each subExp, rendering one at a time. """
+        return self.renderPoints(self.iterParams())
+
+    def renderPoints(self, points):
+        """ Generate (i, params, fileContent) for each (i, params) in points. """
+        for i, param in points:
+            with profiler.span('ConfParser.render'):
+                fileContent = self.renderFromParams(param)
+            yield (i, param, fileContent)
+
+    @property
+    def params(self):
+        return [param for i, param in self.iterParams()]
+
+    @property
+    def output(self):
+        """ Fully materialized list of (i, params, fileContent). Prefer iterOutput() for big batches. """
+        return list(self.iterOutput())
 
     def renderFromParams(self, params):
         """ Render the configuration file template from given parameters. """
         return self.jtmpl.render(**params)
+
+def stripMrlLines(content):
+    """ Rendered config without the trailing MRL instruction lines, to compare configs across grid changes. """
+    lines = content.rstrip('\n').split('\n')
+    while lines and (not lines[-1].strip() or lines[-1].split(None, 1)[-1].split(':', 1)[0] == 'MRL'):
+        lines.pop()
+    return '\n'.join(lines)
+
+#### Sampled expansion: distributions map a point u in [0, 1) to a value, samplers draw the points.
+
+class uniform:
+    def __init__(self, low, high):
+        self.low, self.high = float(low), float(high)
+    def fromUnit(self, u):
+        return self.low + u * (self.high - self.low)
+
+class loguniform:
+    def __init__(self, low, high):
+        if low <= 0 or high <= 0:
+            raise ValueError("loguniform needs positive bounds")
+        self.low, self.high = math.log(low), math.log(high)
+    def fromUnit(self, u):
+        return math.exp(self.low + u * (self.high - self.low))
+
+class randint:
+    """ Integer in [low, high], both included. """
+    def __init__(self, low, high):
+        self.low, self.high = int(low), int(high)
+    def fromUnit(self, u):
+        return min(self.low + int(u * (self.high - self.low + 1)), self.high)
+
+class choice:
+    def __init__(self, values):
+        self.values = list(values)
+    def fromUnit(self, u):
+        return self.values[min(int(u * len(self.values)), len(self.values) - 1)]
+
+def randomSampler(n, d, seed):
+    """ Independent uniform points. Growing n keeps the first points. """
+    rng = random.Random(seed)
+    return [[rng.random() for j in range(d)] for i in range(n)]
+
+def lhsSampler(n, d, seed):
+    """ Latin hypercube: in every dimension, exactly one point per stratum [k/n, (k+1)/n). """
+    rng = random.Random(seed)
+    cols = []
+    for j in range(d):
+        strata = range(n)
+        rng.shuffle(strata)
+        cols.append([(k + rng.random()) / n for k in strata])
+    return [list(point) for point in zip(*cols)]
+
+# Sobol direction numbers (s, a, m_1..m_s) for dimensions 2.., from Joe & Kuo (2008), new-joe-kuo-6.21201.
+sobolDirections = [
+    (1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1]), (3, 2, [1, 1, 1]), (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]), (5, 2, [1, 1, 5, 5, 17]), (5, 4, [1, 1, 5, 5, 5]), (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]), (5, 13, [1, 1, 1, 3, 11]), (5, 14, [1, 3, 5, 5, 31]), (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]), (6, 16, [1, 3, 1, 13, 27, 49]), (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]), (6, 25, [1, 1, 5, 5, 19, 61]), (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+sobolBits = 32
+
+def sobolSampler(n, d, seed, shift=True):
+    """
+    Sobol sequence (gray code order), with a random digital shift from seed so different seeds give
+    different, equally well spread point sets. Growing n keeps the first points; powers of 2 are best balanced.
+    """
+    if d > len(sobolDirections) + 1:
+        raise ConfParserException("sobol sampler supports up to {} sampled keys".format(len(sobolDirections) + 1))
+    V = []
+    for j in range(d):
+        if j == 0:
+            v = [1 << (sobolBits - 1 - i) for i in range(sobolBits)]
+        else:
+            s, a, m = sobolDirections[j-1]
+            v = [m[i] << (sobolBits - 1 - i) for i in range(s)]
+            for i in range(s, sobolBits):
+                x = v[i-s] ^ (v[i-s] >> s)
+                for k in range(1, s):
+                    if (a >> (s - 1 - k)) & 1: x ^= v[i-k]
+                v.append(x)
+        V.append(v)
+    rng = random.Random(seed)
+    shifts = [rng.getrandbits(sobolBits) if shift else 0 for j in range(d)]
+    x, points = [0] * d, []
+    for i in range(n):
+        if i:
+            c = 0 # rightmost zero bit of i-1
+            while (i - 1) >> c & 1: c += 1
+            x = [xj ^ V[j][c] for j, xj in enumerate(x)]
+        points.append([(xj ^ shifts[j]) / float(1 << sobolBits) for j, xj in enumerate(x)])
+    return points
+
+samplers = {'random': randomSampler, 'lhs': lhsSampler, 'sobol': sobolSampler}
@@ -0,0 +1,151 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Disk usage of the experiments for mrl du, and pruning of old checkpoints for mrl gc.
+# du scans the subExp dirs in a thread pool (stat calls release the GIL, which is what matters on NFS)
+# and caches per directory (mtime, bytes of its files, subdir names) in outdir/.mrl.cache/du.json.
+# A directory's mtime only changes when entries are added, removed or renamed, not when a file in it grows,
+# so cached entries are only trusted for experiments and subExps that are done.
+
+import os
+import json
+import fnmatch
+from os.path import join, isdir
+try:
+    from os import scandir
+except ImportError: # python 2, unless the scandir backport is installed
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+duCacheFn = 'du.json' # inside outdir/cacheDir
+
+def scanDir(path):
+    """ (allocated bytes of the files directly in path, names of its subdirs). Symlinks are not followed. """
+    own, subdirs = 0, []
+    if scandir is not None:
+        for entry in scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            else:
+                own += entry.stat(follow_symlinks=False).st_blocks * 512
+        return own, subdirs
+    for name in os.listdir(path):
+        st = os.lstat(join(path, name))
+        if st.st_mode >> 12 == 0o04:
+            subdirs.append(name)
+        else:
+            own += st.st_blocks * 512
+    return own, subdirs
+
+def dirUsage(outdir, rel, cache, newCache, trust, skip=()):
+    """
+    Allocated bytes under outdir/rel, recursively. Reuses the cache entry of a directory if trust and its mtime is unchanged.
+    Entries of the scanned dirs go to newCache. skip: names of subdirs of rel itself that are not counted.
+    """
+    path = join(outdir, rel)
+    try:
+        mtime = os.lstat(path).st_mtime
+        entry = cache.get(rel)
+        if not (trust and entry and entry[0] == mtime):
+            entry = [mtime] + list(scanDir(path))
+    except OSError: # removed while scanning
+        return 0
+    newCache[rel] = entry
+    return entry[1] + sum(dirUsage(outdir, join(rel, d), cache, newCache, trust) for d in entry[2] if d not in skip)
+
+def loadCache(cacheDir):
+    try:
+        with open(join(cacheDir, duCacheFn)) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {}
+
+def saveCache(cacheDir, cache):
+    if not isdir(cacheDir): os.makedirs(cacheDir)
+    fn = join(cacheDir, duCacheFn)
+    tmpfn = '{}.{}.tmp'.format(fn, os.getpid())
+    with open(tmpfn, 'w') as fh:
+        json.dump(cache, fh, separators=(',', ':'))
+    os.rename(tmpfn, fn)
+
+def usage(outdir, exps, cacheDir, jobs=16, fresh=False):
+    """
+    {expName: (bytes of the expDir without its subExps, {subExpId: bytes})} for the Experiments exps.
+    The cache entries of other experiments are kept.
+    """
+    from multiprocessing.pool import ThreadPool
+    cache = {} if fresh else loadCache(cacheDir)
+    newCache = {}
+    units = [] # (exp, subExp or None): the subExp dirs and the rest of every expDir
+    for exp in exps:
+        units.append((exp, None))
+        units += [(exp, subExp) for subExp in exp]
+    def unitUsage((exp, subExp)):
+        if subExp is None:
+            return dirUsage(outdir, exp.name, cache, newCache, exp.done, set(exp.subExpIds))
+        return dirUsage(outdir, join(exp.name, subExp.subExpId), cache, newCache, exp.done or subExp.done)
+    pool = ThreadPool(jobs)
+    try:
+        sizes = pool.map(unitUsage, units, chunksize=1)
+    finally:
+        pool.terminate()
+    result = {}
+    for (exp, subExp), size in zip(units, sizes):
+        own, subExpSizes = result.setdefault(exp.name, (0, {}))
+        if subExp is None:
+            result[exp.name] = (size, subExpSizes)
+        else:
+            subExpSizes[subExp.subExpId] = size
+    scanned = set(result)
+    newCache.update((k, v) for k, v in cache.iteritems() if k.split(os.sep, 1)[0] not in scanned)
+    saveCache(cacheDir, newCache)
+    return result
+
+def humanSize(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024:
+            return '{:.1f} {}'.format(n, unit) if unit != 'B' else '{} B'.format(n)
+        n /= 1024.
+    return '{:.1f} TB'.format(n)
+
+#### Checkpoint pruning for mrl gc
+
+def checkRules(rules):
+    """ Validate cfg.gc_checkpoints, raises ValueError. """
+    for rule in rules:
+        if 'pattern' not in rule or not ('last' in rule or 'best' in rule):
+            raise ValueError("gc_checkpoints rule needs a pattern and last and/or best: {}".format(rule))
+        if 'best' in rule and ('score' not in rule or rule.get('order', 'min') not in ('min', 'max')):
+            raise ValueError("gc_checkpoints rule with best needs a score regex and order min or max: {}".format(rule))
+
+def prunable(subExpDir, rules):
+    """
+    [(relpath, bytes)] of the files in subExpDir that match a rule of cfg.gc_checkpoints but are kept by none:
+    every rule keeps the last (newest mtime) and the best (score regex group 1 of the name, lowest or highest) of its matches.
+    Files whose name has no score are kept.
+    """
+    import re
+    files = [] # (relpath, name, stat)
+    for dirpath, dirnames, filenames in os.walk(subExpDir):
+        for name in filenames:
+            st = os.lstat(join(dirpath, name))
+            if st.st_mode >> 12 == 0o10:
+                files.append((os.path.relpath(join(dirpath, name), subExpDir), name, st))
+    remove, keep = {}, set()
+    for rule in rules:
+        pattern = rule['pattern']
+        matched = [f for f in files if fnmatch.fnmatch(f[0] if '/' in pattern else f[1], pattern)]
+        keep.update(rel for rel, name, st in sorted(matched, key=lambda f: -f[2].st_mtime)[:rule.get('last', 0)])
+        if 'best' in rule:
+            scored = []
+            for rel, name, st in matched:
+                m = re.search(rule['score'], name)
+                try:
+                    scored.append((float(m.group(1)), rel))
+                except (AttributeError, IndexError, ValueError):
+                    keep.add(rel)
+            scored.sort(reverse=rule.get('order', 'min') == 'max')
+            keep.update(rel for score, rel in scored[:rule['best']])
+        remove.update((rel, st.st_blocks * 512) for rel, name, st in matched)
+    return sorted((rel, size) for rel, size in remove.iteritems() if rel not in keep)
@@ -17,3 +17,5 @@ class BatchException(Exception):
     pass
 class ConfParserException(Exception):
     pass
+class SubExpIdException(Exception):
+    pass
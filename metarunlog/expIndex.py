@@ -0,0 +1,97 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Persistent index of the experiments in outdir, so that ls / info / expId resolution
+# don't need to listdir the outdir and open every .mrl file on each invocation.
+
+import os
+import time
+from os import listdir
+from os.path import join, isdir
+import json
+from collections import OrderedDict
+
+INDEX_VERSION = 2
+
+class ExpIndex:
+    """
+    On-disk cache of per-experiment facts: the .mrl contents, the list of subExps
+    and whether the experiment is marked done.
+    Staleness is checked by directory mtime: the outdir mtime guards the list of
+    experiments, each expDir mtime guards the entry of that experiment
+    (creating subExps, .mrl.done or rewriting .mrl via new/makebatch all bump it),
+    together with the size and mtime of the expDir/.mrl file itself, for edits in place.
+    Entries loaded within a second of such an mtime are rebuilt next time, since a change
+    in the same second would not change the mtime.
+    The index lives in its own subdirectory of outdir, so that saving it
+    does not invalidate the outdir mtime.
+    """
+    def __init__(self, outdir, cacheDir, expFormat):
+        self.outdir    = outdir
+        self.cacheDir  = join(outdir, cacheDir)
+        self.fn        = join(self.cacheDir, 'index.json')
+        self.expFormat = expFormat
+        self.dirty     = False
+        try:
+            with open(self.fn) as fh:
+                data = json.load(fh, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError):
+            data = {}
+        if data.get('version') != INDEX_VERSION or data.get('expFormat') != expFormat:
+            data = {}
+        self.outdirMtime = data.get('outdirMtime')
+        self.expDirs     = data.get('expDirs', [])
+        self.entries     = data.get('exps', {})
+        for entry in self.entries.itervalues():
+            entry['subExps'] = [str(x) for x in entry['subExps']]
+
+    def getExpDirList(self, checkValidExp):
+        """ sorted list of experiment directory names, only re-listed if outdir changed. """
+        mtime = os.stat(self.outdir).st_mtime
+        if mtime != self.outdirMtime:
+            self.expDirs = sorted([str(x) for x in listdir(self.outdir) if checkValidExp(x)])
+            self.outdirMtime = mtime
+            self.entries = {k:v for k,v in self.entries.iteritems() if k in self.expDirs}
+            self.dirty = True
+        return [str(x) for x in self.expDirs]
+
+    def get(self, expDirName, loadEntry):
+        """
+        Return the cached entry for expDirName, or (re)build it with
+        loadEntry() -> (expConfig, subExpList, done) if the expDir changed.
+        """
+        mtime = os.stat(join(self.outdir, expDirName)).st_mtime
+        try:
+            st = os.stat(join(self.outdir, expDirName, '.mrl'))
+            mrlStat = [st.st_size, st.st_mtime]
+        except OSError: # archived
+            mrlStat = None
+        entry = self.entries.get(expDirName)
+        if entry is None or entry['mtime'] != mtime or entry['mrl'] != mrlStat:
+            # stats are taken before loading, a concurrent change makes the entry stale again
+            expConfig, subExps, done = loadEntry()
+            if time.time() - 1 <= max(mtime, mrlStat[1] if mrlStat else 0):
+                mrlStat = 'racy' # never matches, rebuilt on the next get
+            entry = OrderedDict([('mtime', mtime), ('mrl', mrlStat), ('conf', expConfig), ('subExps', subExps), ('done', done)])
+            self.entries[expDirName] = entry
+            self.dirty = True
+        return entry
+
+    def invalidate(self, expDirName=None):
+        """ Drop one entry, or the whole experiment list if expDirName is None. """
+        if expDirName is None:
+            self.outdirMtime = None
+        else:
+            self.entries.pop(expDirName, None)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty: return
+        if not isdir(self.cacheDir): os.mkdir(self.cacheDir)
+        data = OrderedDict([('version', INDEX_VERSION), ('expFormat', self.expFormat),
+            ('outdirMtime', self.outdirMtime), ('expDirs', self.expDirs), ('exps', self.entries)])
+        tmpfn = '{}.{}.tmp'.format(self.fn, os.getpid())
+        with open(tmpfn, 'w') as fh:
+            json.dump(data, fh)
+            fh.write("\n")
+        os.rename(tmpfn, self.fn)
+        self.dirty = False
@@ -0,0 +1,275 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Git state of the basedir for mrl new, read directly from the .git directory:
+# HEAD, loose refs and packed-refs for the commit, the commit object (loose or undeltified in a pack)
+# for its description, and the index with its stat cache for uncommitted changes.
+# Anything out of the ordinary (staged changes, submodules, deltified commits, untracked scan, ...)
+# falls back to running git once.
+
+import os
+import struct
+import zlib
+from os.path import join, isdir, isfile, dirname, abspath
+
+shortHashLen = 7
+maxIndexEntries = 10000 # above this, git's C loop over the index beats the python one (see bench/gitstate.py)
+
+class GitState:
+    def __init__(self, sha, description, changes):
+        self.sha         = sha
+        self.shortHash   = sha[:shortHashLen]
+        self.description = description
+        self.changes     = changes # git status --porcelain lines, empty when clean
+
+    @property
+    def clean(self):
+        return not self.changes
+
+class Fallback(Exception):
+    """ The fast path can't decide, ask git. """
+    pass
+
+def findGitDir(path):
+    """ (gitDir, commonDir, workTree) of the repository containing path, or None. """
+    path = abspath(path)
+    while True:
+        dotgit = join(path, '.git')
+        if isdir(dotgit):
+            gitDir = dotgit
+            break
+        if isfile(dotgit): # worktree or submodule: "gitdir: <path>"
+            with open(dotgit) as fh:
+                line = fh.read().strip()
+            if not line.startswith('gitdir: '): return None
+            gitDir = join(path, line[len('gitdir: '):])
+            break
+        if dirname(path) == path: return None
+        path = dirname(path)
+    commonDir = gitDir
+    if isfile(join(gitDir, 'commondir')):
+        with open(join(gitDir, 'commondir')) as fh:
+            commonDir = abspath(join(gitDir, fh.read().strip()))
+    return gitDir, commonDir, path
+
+def resolveRef(gitDir, commonDir, ref):
+    """ sha of ref (eg 'HEAD', 'refs/heads/master'), following symbolic refs. """
+    for i in range(10):
+        fn = join(gitDir if ref == 'HEAD' else commonDir, ref)
+        if isfile(fn):
+            with open(fn) as fh:
+                content = fh.read().strip()
+            if not content.startswith('ref: '): return content
+            ref = content[len('ref: '):]
+            continue
+        if isfile(join(commonDir, 'packed-refs')):
+            with open(join(commonDir, 'packed-refs')) as fh:
+                for line in fh:
+                    if line[:1] in '#^': continue
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref: return parts[0]
+        raise Fallback('unresolved ref ' + ref)
+    raise Fallback('symbolic ref loop')
+
+def _packedObject(commonDir, sha):
+    """ (type, data) of a non-delta object from the pack files, or None if not found. """
+    import mmap
+    packDir = join(commonDir, 'objects', 'pack')
+    if not isdir(packDir): return None
+    binsha = sha.decode('hex')
+    for idxfn in [f for f in os.listdir(packDir) if f.endswith('.idx')]:
+        with open(join(packDir, idxfn), 'rb') as fh:
+            idx = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if idx[:8] != '\377tOc\0\0\0\2': raise Fallback('pack index version')
+            fanout = struct.unpack_from('>256I', idx, 8)
+            n = fanout[255]
+            lo = fanout[ord(binsha[0]) - 1] if binsha[0] != '\0' else 0
+            hi = fanout[ord(binsha[0])]
+            shaOfs = 8 + 256 * 4
+            while lo < hi:
+                mid = (lo + hi) // 2
+                cand = idx[shaOfs + 20 * mid: shaOfs + 20 * mid + 20]
+                if cand < binsha: lo = mid + 1
+                elif cand > binsha: hi = mid
+                else: break
+            else:
+                continue
+            offsetsOfs = shaOfs + 24 * n
+            offset = struct.unpack_from('>I', idx, offsetsOfs + 4 * mid)[0]
+            if offset & 0x80000000:
+                offset = struct.unpack_from('>Q', idx, offsetsOfs + 4 * n + 8 * (offset & 0x7fffffff))[0]
+        finally:
+            idx.close()
+        with open(join(packDir, idxfn[:-4] + '.pack'), 'rb') as fh:
+            fh.seek(offset)
+            c = ord(fh.read(1))
+            otype, size, shift = (c >> 4) & 7, c & 15, 4
+            while c & 0x80:
+                c = ord(fh.read(1))
+                size |= (c & 0x7f) << shift
+                shift += 7
+            if otype not in (1, 2, 3, 4): raise Fallback('deltified object')
+            d, data = zlib.decompressobj(), ''
+            while len(data) < size:
+                chunk = fh.read(4096)
+                if not chunk: break
+                data += d.decompress(chunk)
+            return ['', 'commit', 'tree', 'blob', 'tag'][otype], data[:size]
+    return None
+
+def readObject(commonDir, sha):
+    """ (type, data) of object sha. """
+    fn = join(commonDir, 'objects', sha[:2], sha[2:])
+    if isfile(fn):
+        with open(fn, 'rb') as fh:
+            raw = zlib.decompress(fh.read())
+        header, data = raw.split('\0', 1)
+        return header.split()[0], data
+    obj = _packedObject(commonDir, sha)
+    if obj is None: raise Fallback('object {} not found'.format(sha))
+    return obj
+
+def parseCommit(data):
+    """ (tree sha, subject) of a commit object, subject as in git log --format=%s. """
+    header, _, message = data.partition('\n\n')
+    tree = header.split('\n', 1)[0].split()[1]
+    subject = ' '.join(line.strip() for line in message.split('\n\n', 1)[0].splitlines())
+    return tree, subject
+
+# index entry fields used: mtime (s), ino, mode, size, sha, flags
+indexEntry = struct.Struct('>8xI8xII8xI20sH')
+typeExecBits = 0o170100 # file type and owner exec bit of st_mode / index mode
+
+def _readIndex(gitDir):
+    """ ([(path, mtime, ino, mode, size, binsha, flags)], root tree sha from the cache-tree or None, index mtime). """
+    fn = join(gitDir, 'index')
+    if not isfile(fn): raise Fallback('no index')
+    with open(fn, 'rb') as fh:
+        data = fh.read(12)
+        sig, version, n = struct.unpack('>4sII', data)
+        if sig != 'DIRC' or version not in (2, 3): raise Fallback('index version {}'.format(version))
+        if n > maxIndexEntries: raise Fallback('large index')
+        data += fh.read()
+    mtime = os.stat(fn).st_mtime
+    entries, pos, unpack = [], 12, indexEntry.unpack_from
+    for i in xrange(n):
+        ms, ino, mode, size, binsha, flags = unpack(data, pos)
+        hdr = 62
+        if flags & 0x4000: # extended flags
+            if ord(data[pos + 62]) & 0x60: raise Fallback('skip-worktree or intent-to-add entries')
+            hdr = 64
+        namelen = flags & 0xfff
+        if namelen == 0xfff: namelen = data.index('\0', pos + hdr) - pos - hdr
+        entries.append((data[pos + hdr: pos + hdr + namelen], ms, ino, mode, size, binsha, flags))
+        pos += (hdr + namelen + 8) & ~7
+    rootTree = None
+    while pos + 8 <= len(data) - 20: # extensions, then the trailing checksum
+        ext, extLen = struct.unpack_from('>4sI', data, pos)
+        if ext == 'link': raise Fallback('split index')
+        if ext == 'TREE':
+            body = data[pos + 8: pos + 8 + extLen]
+            nul = body.index('\0')
+            count, _, rest = body[nul + 1:].partition('\n')
+            if body[:nul] == '' and int(count.split()[0]) >= 0:
+                rootTree = rest[:20].encode('hex')
+        pos += 8 + extLen
+    return entries, rootTree, mtime
+
+def _blobSha(fn, size):
+    import hashlib
+    h = hashlib.sha1('blob {}\0'.format(size))
+    with open(fn, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), ''):
+            h.update(block)
+    return h.digest()
+
+def worktreeChanges(workTree, entries, indexMtime):
+    """ git status --porcelain style lines for tracked files that differ from the index. """
+    changes = []
+    lstat, prefix, indexMtime = os.lstat, workTree + '/', int(indexMtime)
+    for path, ms, ino, mode, size, binsha, flags in entries:
+        try:
+            st = lstat(prefix + path)
+        except OSError:
+            changes.append(' D ' + path)
+            continue
+        # stat cache hit: same type, exec bit, size, mtime and inode, and not modified in the second the index was written
+        if st[0] & typeExecBits == mode & typeExecBits and st[6] & 0xffffffff == size and \
+                st[8] == ms and st[1] & 0xffffffff == ino and ms < indexMtime and not flags & 0x3000:
+            continue
+        if flags & 0x3000: raise Fallback('unmerged entries')
+        if flags & 0x8000: continue # assume-valid
+        if mode >> 12 != 0o10: raise Fallback('symlinks or submodules')
+        if st[0] >> 12 != 0o10:
+            changes.append(' T ' + path)
+        elif st[0] & 0o100 != mode & 0o100 or st[6] & 0xffffffff != size:
+            changes.append(' M ' + path)
+        elif _blobSha(prefix + path, st[6]) != binsha: # content check, like git's refresh; no clean/smudge filters
+            changes.append(' M ' + path)
+    return changes
+
+def readTree(commonDir, sha, prefix=''):
+    """ {path: (mode, binsha)} of all files in tree sha, recursively. """
+    otype, data = readObject(commonDir, sha)
+    files, pos = {}, 0
+    while pos < len(data):
+        sp = data.index(' ', pos)
+        nul = data.index('\0', sp)
+        mode, name, binsha = int(data[pos:sp], 8), data[sp + 1:nul], data[nul + 1:nul + 21]
+        pos = nul + 21
+        if mode == 0o40000:
+            files.update(readTree(commonDir, binsha.encode('hex'), prefix + name + '/'))
+        else:
+            files[prefix + name] = (mode, binsha)
+    return files
+
+def stagedChanges(commonDir, tree, entries):
+    """ git status --porcelain style lines for index entries that differ from the HEAD tree. """
+    headFiles = readTree(commonDir, tree)
+    changes = []
+    for path, ms, ino, mode, size, binsha, flags in entries:
+        head = headFiles.pop(path, None)
+        if head is None:
+            changes.append('A  ' + path)
+        elif head != (mode, binsha):
+            changes.append('M  ' + path)
+    changes += ['D  ' + path for path in sorted(headFiles)]
+    return changes
+
+def _gitStatus(workTree, untracked):
+    import subprocess
+    out = subprocess.check_output(['git', 'status', '--porcelain', '--untracked=' + ('normal' if untracked else 'no')], cwd=workTree)
+    return [line for line in out.split('\n') if line]
+
+def _gitCommit(workTree):
+    import subprocess
+    out = subprocess.check_output(['git', 'log', '-n1', '--format=%H%x00%s'], cwd=workTree)
+    sha, subject = out.strip('\n').split('\0', 1)
+    return sha, subject
+
+def gitState(path, untracked=False):
+    """
+    GitState of the repository containing path. Without untracked, untracked files are not scanned
+    (like git status --untracked=no), otherwise git is called once for the status.
+    """
+    found = findGitDir(path)
+    if not found:
+        raise OSError('Not a git repository: {}'.format(path))
+    gitDir, commonDir, workTree = found
+    try:
+        sha = resolveRef(gitDir, commonDir, 'HEAD')
+        otype, data = readObject(commonDir, sha)
+        tree, subject = parseCommit(data)
+    except Fallback:
+        sha, subject = _gitCommit(workTree)
+        tree = None
+    if untracked:
+        return GitState(sha, subject, _gitStatus(workTree, untracked))
+    try:
+        if tree is None: raise Fallback('no commit')
+        entries, rootTree, indexMtime = _readIndex(gitDir)
+        changes = [] if rootTree == tree else stagedChanges(commonDir, tree, entries) # cache-tree valid: nothing staged
+        changes += worktreeChanges(workTree, entries, indexMtime)
+    except Fallback:
+        changes = _gitStatus(workTree, untracked)
+    return GitState(sha, subject, changes)
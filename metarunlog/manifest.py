@@ -0,0 +1,58 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Per-experiment manifest expDir/.mrl.manifest: the params of all subExps in one JSON-lines file,
+# written by makebatch, so analyze / info / query don't need to open one .mrl file per subExp.
+# The subExp .mrl files stay the source of truth: the manifest is only used while the subExp ids,
+# and with check 'stat' also the size and mtime of every .mrl file, match what it recorded.
+
+import os
+import json
+from os.path import join
+
+manifestFn = '.mrl.manifest'
+MANIFEST_VERSION = 1
+
+def write(expDir, rows, header=None):
+    """ rows: [(subExpId, params)] of subExps whose .mrl files are already in place. header: extra fields for the first line. """
+    fn = join(expDir, manifestFn)
+    tmpfn = '{}.{}.tmp'.format(fn, os.getpid())
+    with open(tmpfn, 'w') as fh:
+        fh.write(json.dumps(dict(header or {}, version=MANIFEST_VERSION, nSubExps=len(rows))) + '\n')
+        for subExpId, params in rows:
+            st = os.stat(join(expDir, subExpId, '.mrl'))
+            fh.write(json.dumps({'subExpId': subExpId, 'mrl': [st.st_size, st.st_mtime], 'params': params}) + '\n')
+    os.rename(tmpfn, fn)
+
+def readHeader(expDir):
+    """ First line of the manifest (version, nSubExps and what makebatch added, eg bodyHash), {} if there is none. """
+    from metarunlog.archive import openFile
+    try:
+        with openFile(join(expDir, manifestFn)) as fh:
+            return json.loads(fh.readline())
+    except (IOError, ValueError):
+        return {}
+
+def load(expDir, subExpIds, check='stat'):
+    """ List of params for subExpIds, or None if there is no manifest or it doesn't match the subExps. """
+    from metarunlog.util import _decode_hook
+    from metarunlog.archive import openFile
+    if not os.path.isfile(join(expDir, manifestFn)):
+        check = 'ids' # from the archive of an archived expDir, which doesn't change
+    try:
+        with openFile(join(expDir, manifestFn)) as fh:
+            lines = fh.read().splitlines()
+        header = json.loads(lines[0])
+        rows = json.loads('[' + ','.join(lines[1:]) + ']', object_hook=_decode_hook)
+    except (IOError, ValueError, IndexError):
+        return None
+    if header.get('version') != MANIFEST_VERSION or [row['subExpId'] for row in rows] != list(subExpIds):
+        return None
+    if check == 'stat':
+        for row in rows:
+            try:
+                st = os.stat(join(expDir, row['subExpId'], '.mrl'))
+            except OSError:
+                return None
+            if [st.st_size, st.st_mtime] != row['mrl']:
+                return None
+    return [row['params'] for row in rows]
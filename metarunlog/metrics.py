@@ -0,0 +1,176 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Incremental parsing of subExp log files into a columnar binary store,
+# so analysis functions don't each have to re-parse the same text logs.
+#
+# Configure in .mrl.cfg, per log file (relative to the subExp dir) either a regex
+# with named groups, or the name of a callback function in mrl_analyze
+# which takes a line and returns a {column: value} dict or None:
+#   "metrics": {"train.log": {"regex": "iter (?P<iter>\\d+) loss (?P<loss>\\S+)"},
+#               "valid.log": {"callback": "parseValidLine"}}
+# The store is subExpDir/.mrl.metrics/<log>/<column>.f8 (raw float64, one value per parsed line,
+# NaN where a line didn't have that column) plus state.json which remembers the byte offset
+# up to which the log was parsed, so only newly appended lines are parsed on the next ingest.
+# Every ingest that changes a store also touches expDir/.mrl.metrics.stamp, so readers like mrl query
+# can tell from one stat per experiment that none of its stores changed.
+
+import os
+from os.path import join, isdir, isfile
+import re
+import json
+from array import array
+
+storeDirName = '.mrl.metrics'
+stampFn = '.mrl.metrics.stamp' # in the expDir
+NaN = float('nan')
+
+def _storeDir(subExpDir, logfn):
+    return join(subExpDir, storeDirName, logfn.replace(os.sep, '__'))
+
+def _lineParser(spec):
+    if 'regex' in spec:
+        regex = re.compile(spec['regex'])
+        def parseLine(line):
+            m = regex.search(line)
+            return m.groupdict() if m else None
+        return parseLine
+    elif 'callback' in spec:
+        import mrl_analyze # from basedir, user-supplied
+        return getattr(mrl_analyze, spec['callback'])
+    raise ValueError("metrics spec needs a regex or callback: {}".format(spec))
+
+def _toFloat(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return NaN
+
+def ingest(subExpDir, logfn, spec):
+    """
+    Parse the lines appended to subExpDir/logfn since the last ingest into the store.
+    Only complete lines are parsed. A truncated or replaced log is re-parsed from the start.
+    Returns the number of new rows.
+    """
+    logpath = join(subExpDir, logfn)
+    if not isfile(logpath): return 0
+    storeDir = _storeDir(subExpDir, logfn)
+    if not isdir(storeDir): os.makedirs(storeDir)
+    state = _loadState(storeDir, repair=True)
+    st = os.stat(logpath)
+    if st.st_ino != state['inode'] or st.st_size < state['offset']:
+        for col in state['columns']:
+            os.remove(join(storeDir, col + '.f8'))
+        state = {'inode': st.st_ino, 'offset': 0, 'nrows': 0, 'columns': []}
+        _touchStamp(subExpDir)
+    if st.st_size == state['offset']: return 0
+    with open(logpath, 'rb') as fh:
+        fh.seek(state['offset'])
+        data = fh.read(st.st_size - state['offset'])
+    end = data.rfind('\n') + 1
+    if not end: return 0 # no complete line yet
+    parseLine = _lineParser(spec)
+    rows = [row for row in (parseLine(line) for line in data[:end].splitlines()) if row]
+    newCols = sorted(set(k for row in rows for k in row) - set(state['columns']))
+    for col in newCols: # backfill
+        with open(join(storeDir, col + '.f8'), 'wb') as fh:
+            (array('d', [NaN]) * state['nrows']).tofile(fh)
+    state['columns'] += newCols
+    for col in state['columns']:
+        with open(join(storeDir, col + '.f8'), 'ab') as fh:
+            array('d', [_toFloat(row.get(col)) for row in rows]).tofile(fh)
+    state['offset'] += end
+    state['nrows'] += len(rows)
+    _saveState(storeDir, state)
+    _touchStamp(subExpDir)
+    return len(rows)
+
+def _touchStamp(subExpDir):
+    fn = join(os.path.dirname(os.path.abspath(subExpDir)), stampFn)
+    with open(fn, 'a'):
+        os.utime(fn, None)
+
+def stamp(expDir):
+    """ mtime of the last ingest into the stores of expDir's subExps (of the archive when archived), None if unknown. """
+    from metarunlog.archive import archiveFn
+    for fn in [stampFn, archiveFn]:
+        try:
+            return os.stat(join(expDir, fn)).st_mtime
+        except OSError:
+            pass
+    return None
+
+def _loadState(storeDir, repair=False):
+    from metarunlog.archive import openFile
+    try:
+        with openFile(join(storeDir, 'state.json')) as fh:
+            state = json.load(fh)
+        state['columns'] = [str(c) for c in state['columns']]
+    except (IOError, ValueError):
+        return {'inode': None, 'offset': 0, 'nrows': 0, 'columns': []}
+    # drop values appended after the last saved state (interrupted ingest). Columns of the right size
+    # are left alone, so their mtime (part of the AnalysisCache key) only changes when rows are added.
+    for col in (state['columns'] if repair else []):
+        fn = join(storeDir, col + '.f8')
+        if os.path.getsize(fn) > state['nrows'] * 8:
+            with open(fn, 'r+b') as fh:
+                fh.truncate(state['nrows'] * 8)
+    return state
+
+def _saveState(storeDir, state):
+    tmpfn = join(storeDir, 'state.json.{}.tmp'.format(os.getpid()))
+    with open(tmpfn, 'w') as fh:
+        json.dump(state, fh)
+    os.rename(tmpfn, join(storeDir, 'state.json'))
+
+def ingestSubExp(subExpDir, metricsCfg):
+    """ Ingest all logs configured in metricsCfg ({logfn: spec}) for one subExp. """
+    return sum(ingest(subExpDir, logfn, spec) for logfn, spec in sorted(metricsCfg.items()))
+
+def _ingestSubExpStar(a):
+    return ingestSubExp(*a)
+
+def ingestAll(subExpDirs, metricsCfg, jobs=1):
+    """ Ingest for all subExpDirs, with jobs > 1 in a process pool. Returns total new rows. """
+    if not metricsCfg: return 0
+    calls = [(subExpDir, metricsCfg) for subExpDir in subExpDirs]
+    if jobs <= 1:
+        return sum(map(_ingestSubExpStar, calls))
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return sum(pool.map(_ingestSubExpStar, calls))
+    finally:
+        pool.terminate()
+
+def logNames(subExpDir):
+    """ Names of the logs that have a metrics store in subExpDir. """
+    from metarunlog import archive
+    storeRoot = join(subExpDir, storeDirName)
+    if not archive.isdir(storeRoot): return []
+    return sorted(x.replace('__', os.sep) for x in archive.listdir(storeRoot))
+
+def load(subExpDir, logfn=None, asFrame=False):
+    """
+    Load the metrics of subExpDir/logfn as a dict {column: read-only memory-mapped float64 array},
+    or as a pandas DataFrame with asFrame. logfn can be omitted if only one log is ingested.
+    For use in mrl_analyze functions.
+    """
+    import numpy as np
+    from metarunlog import archive
+    if logfn is None:
+        logs = logNames(subExpDir)
+        if len(logs) != 1:
+            raise ValueError("Specify logfn, metrics stores in {}: {}".format(subExpDir, logs))
+        logfn = logs[0]
+    storeDir = _storeDir(subExpDir, logfn)
+    state = _loadState(storeDir)
+    cols = {}
+    for col in state['columns']:
+        if state['nrows']:
+            cols[col] = archive.memmap(join(storeDir, col + '.f8'), 'f8', (state['nrows'],)) # also from an archived expDir
+        else:
+            cols[col] = np.zeros(0)
+    if asFrame:
+        import pandas as pd
+        return pd.DataFrame(cols, columns=state['columns'])
+    return cols
@@ -0,0 +1,77 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Timing trace of commands, hooks, analysis functions and I/O steps, enabled with mrl -profile.
+# Spans record wall and cpu time, and are aggregated per name (call count, totals).
+# The trace is written in chrome trace format (load in chrome://tracing or ui.perfetto.dev).
+
+import os
+import time
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+enabled = False
+_events = [] # chrome trace "complete" events
+_stats  = OrderedDict() # name -> [count, wall, cpu]
+_lock   = threading.Lock() # spans are also recorded from makebatch writer threads
+
+def enable():
+    global enabled
+    enabled = True
+
+def record(name, t0, wall, cpu, cat='mrl', pid=None, tid=None, args=None):
+    """ Record a finished span that started at time.time() t0. Also used for spans measured in worker processes. """
+    if not enabled: return
+    event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': t0 * 1e6, 'dur': wall * 1e6,
+            'pid': pid or os.getpid(), 'tid': tid or threading.current_thread().ident,
+            'args': dict(args or {}, cpu_ms=cpu * 1e3)}
+    with _lock:
+        _events.append(event)
+        stat = _stats.setdefault(name, [0, 0., 0.])
+        stat[0] += 1
+        stat[1] += wall
+        stat[2] += cpu
+
+@contextmanager
+def span(name, cat='mrl', **args):
+    """ with profiler.span('name'): ... records the block when profiling is enabled. """
+    if not enabled:
+        yield
+        return
+    t0, c0 = time.time(), time.clock()
+    try:
+        yield
+    finally:
+        record(name, t0, time.time() - t0, time.clock() - c0, cat, args=args)
+
+def timed(func, *fargs):
+    """ Call func(*fargs), returning (retval, timing) with timing for record(), or None when disabled. """
+    if not enabled:
+        return func(*fargs), None
+    t0, c0 = time.time(), time.clock()
+    retval = func(*fargs)
+    return retval, {'t0': t0, 'wall': time.time() - t0, 'cpu': time.clock() - c0,
+            'pid': os.getpid(), 'tid': threading.current_thread().ident}
+
+def summary():
+    """ [(name, count, wall, cpu)] sorted by total wall time. """
+    return sorted([(name, s[0], s[1], s[2]) for name, s in _stats.items()], key=lambda x: -x[2])
+
+def summaryString():
+    lines = ['{:40s} {:>7s} {:>10s} {:>10s}'.format('span', 'count', 'wall (s)', 'cpu (s)')]
+    lines += ['{:40s} {:7d} {:10.3f} {:10.3f}'.format(name[:40], count, wall, cpu) for name, count, wall, cpu in summary()]
+    return '\n'.join(lines)
+
+def summaryTable():
+    """ Timing summary as pandas DataFrame, for the analysis report. """
+    import pandas as pd
+    return pd.DataFrame([s[1:] for s in summary()], index=[s[0] for s in summary()],
+            columns=['count', 'wall (s)', 'cpu (s)'])
+
+def writeTrace(fn):
+    d = os.path.dirname(fn)
+    if d and not os.path.isdir(d): os.makedirs(d)
+    with open(fn, 'w') as fh:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, fh)
+        fh.write('\n')
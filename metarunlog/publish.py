@@ -0,0 +1,108 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Incremental publishing of the analysis outdir to the webdir.
+# A manifest keeps the content hash of every file (only re-hashed when size or mtime changed)
+# and what was last published to each webdir, so only new or changed files are copied.
+
+import os
+from os.path import join, isdir, isfile, relpath, dirname
+import json
+import hashlib
+
+def isRemote(path):
+    """ rsync-style host:path destination """
+    return ':' in path.split('/', 1)[0]
+
+def fileHash(fn):
+    h = hashlib.sha1()
+    with open(fn, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), ''):
+            h.update(block)
+    return h.hexdigest()
+
+def _loadManifest(manifestFn):
+    try:
+        with open(manifestFn) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {'files': {}, 'published': {}}
+
+def _saveManifest(manifestFn, manifest):
+    if not isdir(dirname(manifestFn)): os.makedirs(dirname(manifestFn))
+    tmpfn = '{}.{}.tmp'.format(manifestFn, os.getpid())
+    with open(tmpfn, 'w') as fh:
+        json.dump(manifest, fh)
+    os.rename(tmpfn, manifestFn)
+
+def scan(srcdir, manifest, skipDirs=()):
+    """ {relpath: sha1} of all files in srcdir, updating manifest['files'] (size, mtime, sha1). """
+    old, files, hashes = manifest['files'], {}, {}
+    for dirpath, dirnames, filenames in os.walk(srcdir):
+        dirnames[:] = [d for d in dirnames if d not in skipDirs]
+        for fn in filenames:
+            if fn.endswith('.tmp'): continue
+            path = join(dirpath, fn)
+            rel = relpath(path, srcdir)
+            st = os.stat(path)
+            if rel in old and old[rel][:2] == [st.st_size, st.st_mtime]:
+                files[rel] = old[rel]
+            else:
+                files[rel] = [st.st_size, st.st_mtime, fileHash(path)]
+            hashes[rel] = files[rel][2]
+    manifest['files'] = files
+    return hashes
+
+def _atomicCopy(src, dst):
+    import shutil
+    if not isdir(dirname(dst)):
+        try:
+            os.makedirs(dirname(dst))
+        except OSError: # made by another thread
+            if not isdir(dirname(dst)): raise
+    tmpfn = '{}.{}.tmp'.format(dst, os.getpid())
+    shutil.copy2(src, tmpfn)
+    os.rename(tmpfn, dst)
+
+def publish(srcdir, webdir, manifestFn, jobs=8, prune=False, skipDirs=()):
+    """
+    Copy new or changed files from srcdir to webdir, each written to a temp file and renamed in place.
+    Html files are copied last so a page never refers to files that aren't published yet.
+    With prune, files published earlier that no longer exist in srcdir are removed from webdir.
+    A remote (host:path) webdir is synced with rsync, restricted to the changed files.
+    Returns (number copied, number unchanged, number pruned).
+    """
+    manifest = _loadManifest(manifestFn)
+    hashes = scan(srcdir, manifest, skipDirs)
+    published = manifest['published'].get(webdir, {})
+    remote = isRemote(webdir)
+    changed = sorted([rel for rel, h in hashes.items() if published.get(rel) != h or
+            (not remote and not isfile(join(webdir, rel)))], key=lambda rel: (rel.endswith('.html'), rel))
+    removed = sorted(set(published) - set(hashes)) if prune else []
+    if remote:
+        _rsync(srcdir, webdir, changed)
+        if removed: print("Not pruning {} files on remote webdir {}".format(len(removed), webdir))
+        removed = []
+    elif changed:
+        from multiprocessing.pool import ThreadPool
+        assets = [rel for rel in changed if not rel.endswith('.html')]
+        pages  = [rel for rel in changed if rel.endswith('.html')]
+        pool = ThreadPool(jobs)
+        try:
+            for group in [assets, pages]:
+                pool.map(lambda rel: _atomicCopy(join(srcdir, rel), join(webdir, rel)), group)
+        finally:
+            pool.terminate()
+    for rel in removed:
+        if isfile(join(webdir, rel)): os.remove(join(webdir, rel))
+    manifest['published'][webdir] = hashes if prune else dict(published, **hashes)
+    _saveManifest(manifestFn, manifest)
+    return len(changed), len(hashes) - len(changed), len(removed)
+
+def _rsync(srcdir, webdir, changed):
+    import subprocess
+    import tempfile
+    if not changed: return
+    with tempfile.NamedTemporaryFile() as fh:
+        fh.write('\n'.join(changed) + '\n')
+        fh.flush()
+        subprocess.check_call(['rsync', '-az', '--files-from', fh.name, srcdir + '/', webdir + '/'])
@@ -0,0 +1,215 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Query engine over all subExps of all experiments: one pandas table with the params
+# of every subExp and optional summary metrics from the metrics store (see metrics.py),
+# which can be filtered, sorted and cut to the top k.
+
+import os
+from os.path import join, isfile
+import json
+import cPickle as pickle
+
+aggregations = ['min', 'max', 'first', 'last', 'mean', 'count']
+
+def _loadExpParams(call):
+    """ Load the params of all subExps of one experiment. Module-level for the process pool. """
+    from metarunlog import manifest
+    expDir, subExpIds, manifestCheck = call
+    rows = manifest.load(expDir, subExpIds, manifestCheck)
+    if rows is None:
+        rows = []
+        for subExpId in subExpIds:
+            try:
+                with open(join(expDir, subExpId, '.mrl')) as fh:
+                    rows.append(json.load(fh).get('params', {}))
+            except (IOError, ValueError):
+                rows.append({})
+    for params in rows:
+        params.pop('subExpId', None)
+    return rows
+
+def _statKey(path):
+    try:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime)
+    except OSError:
+        return None
+
+def _paramsKey(call):
+    """
+    Validity key of the cached params of one experiment: the stats of its manifest (of the archive when archived)
+    and, with manifestCheck 'stat', of its subExp .mrl files, which can be edited in place. Module-level for the process pool.
+    """
+    from metarunlog import manifest, archive
+    expDir, subExpIds, manifestCheck = call
+    if isfile(join(expDir, archive.archiveFn)):
+        return _statKey(join(expDir, archive.archiveFn))
+    mrlStats = [_statKey(join(expDir, subExpId, '.mrl')) for subExpId in subExpIds] if manifestCheck == 'stat' else None
+    return (_statKey(join(expDir, manifest.manifestFn)), mrlStats)
+
+def _metricsState(call):
+    """ Number of ingested rows of one subExp, None without store. Module-level for the process pool. """
+    subExpDir, logfn = call
+    from metarunlog import metrics
+    from metarunlog.archive import openFile
+    try:
+        with openFile(join(metrics._storeDir(subExpDir, logfn), 'state.json')) as fh:
+            return json.load(fh)['nrows']
+    except (IOError, ValueError):
+        return None
+
+def _summarizeMetrics(call):
+    """ Summary values {col_agg: value} of one subExp. Module-level for the process pool. """
+    subExpDir, logfn, specs = call
+    from metarunlog import metrics
+    import numpy as np
+    summary = {}
+    try:
+        cols = metrics.load(subExpDir, logfn)
+    except (IOError, ValueError):
+        cols = {}
+    for col, agg in specs:
+        vals = cols.get(col)
+        vals = vals[~np.isnan(vals)] if vals is not None else np.zeros(0)
+        name = '{}_{}'.format(col, agg)
+        if agg == 'count':
+            summary[name] = len(vals)
+        elif not len(vals):
+            summary[name] = np.nan
+        elif agg == 'first':
+            summary[name] = vals[0]
+        elif agg == 'last':
+            summary[name] = vals[-1]
+        else:
+            summary[name] = getattr(vals, agg)()
+    return summary
+
+def parseMetricSpecs(metricArgs):
+    """ ['loss:min', 'acc:last,max'] -> [('loss', 'min'), ('acc', 'last'), ('acc', 'max')] """
+    specs = []
+    for arg in metricArgs or []:
+        col, aggs = arg.rsplit(':', 1) if ':' in arg else (arg, 'last')
+        for agg in aggs.split(','):
+            if agg not in aggregations:
+                raise ValueError("Unknown aggregation {} for metric {}, choose from {}".format(agg, col, aggregations))
+            specs.append((col, agg))
+    return specs
+
+class QueryCache:
+    """
+    Pickled params rows per experiment, valid while the expDir mtime and the stats of the manifest
+    (and of the subExp .mrl files, see _paramsKey) are unchanged,
+    and metric summaries per subExp, valid while the number of ingested rows is unchanged.
+    stamps has per experiment and metric specs the metrics.stamp for which all its summaries
+    were checked, so the subExp stores are only read again after an ingest.
+    """
+    def __init__(self, fn):
+        self.fn = fn
+        self.dirty = False
+        try:
+            with open(fn, 'rb') as fh:
+                self.exps, self.metrics, self.stamps = pickle.load(fh)
+        except Exception:
+            self.exps, self.metrics, self.stamps = {}, {}, {}
+
+    def save(self):
+        if not self.dirty: return
+        if not os.path.isdir(os.path.dirname(self.fn)): os.makedirs(os.path.dirname(self.fn))
+        tmpfn = '{}.{}.tmp'.format(self.fn, os.getpid())
+        with open(tmpfn, 'wb') as fh:
+            pickle.dump((self.exps, self.metrics, self.stamps), fh, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpfn, self.fn)
+
+def _mapCalls(func, calls, jobs):
+    if jobs <= 1 or len(calls) <= 1:
+        return map(func, calls)
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(func, calls, chunksize=max(1, len(calls) // (4 * jobs)))
+    finally:
+        pool.terminate()
+
+def loadTable(mrlState, metricSpecs=None, logfn=None, jobs=8):
+    """
+    DataFrame indexed by (expId, subExpId) with a column per param, and a column
+    per (metric, aggregation) in metricSpecs, computed from the metrics store of logfn.
+    Loading of experiments that changed since the last query runs in a pool of jobs processes.
+    """
+    import time
+    import pandas as pd
+    from metarunlog import cfg, metrics
+    cache = QueryCache(join(mrlState.outdir, cfg.cacheDir, 'query.pkl'))
+    exps = mrlState.experiments()
+    # params, per experiment
+    # the key is taken before loading, a concurrent change makes the entry stale again
+    keys = [(exp.mtime,) + (key,) for exp, key in zip(exps, _mapCalls(_paramsKey,
+            [(exp.path, exp.subExpIds, cfg.manifestCheck) for exp in exps], jobs))]
+    stale = [(exp, key) for exp, key in zip(exps, keys) if exp.name not in cache.exps or cache.exps[exp.name][0] != key]
+    calls = [(exp.path, exp.subExpIds, cfg.manifestCheck) for exp, key in stale]
+    for (exp, key), rows in zip(stale, _mapCalls(_loadExpParams, calls, jobs)):
+        cache.exps[exp.name] = (key, rows)
+        cache.dirty = True
+    index, rows = [], []
+    for exp in exps:
+        key, expRows = cache.exps[exp.name]
+        index += [(exp.expId, subExpId) for subExpId in exp.subExpIds]
+        rows += [dict(row) for row in expRows] # copies, metrics are added below
+    # metric summaries, per subExp
+    if metricSpecs:
+        if not logfn and not cfg.metrics:
+            raise ValueError("-metric needs metrics configured in .mrl.cfg, see metrics.py")
+        logfn = logfn or sorted(cfg.metrics)[0]
+        specKey = (logfn, tuple(metricSpecs))
+        now = time.time()
+        subExpDirs, toCheck, checkedExps = [], [], []
+        for exp in exps:
+            dirs = [join(exp.path, subExpId) for subExpId in exp.subExpIds]
+            subExpDirs += dirs
+            stamp = metrics.stamp(exp.path)
+            checked = cache.stamps.get((exp.name,) + specKey) # (stamp, time of the check)
+            # a stamp less than a second older than the check could still change within its mtime resolution
+            if not (checked and checked[0] == stamp and (stamp is None or stamp < checked[1] - 1)
+                    and all((d,) + specKey in cache.metrics for d in dirs)):
+                toCheck += dirs
+                checkedExps.append((exp.name, stamp))
+        nrows = _mapCalls(_metricsState, [(d, logfn) for d in toCheck], jobs)
+        staleDirs = [(d, n) for d, n in zip(toCheck, nrows)
+                if (d,) + specKey not in cache.metrics or cache.metrics[(d,) + specKey][0] != n]
+        summaries = _mapCalls(_summarizeMetrics, [(d, logfn, metricSpecs) for d, n in staleDirs], jobs)
+        for (d, n), summary in zip(staleDirs, summaries):
+            cache.metrics[(d,) + specKey] = (n, summary)
+            cache.dirty = True
+        for expName, stamp in checkedExps:
+            cache.stamps[(expName,) + specKey] = (stamp, now)
+            cache.dirty = True
+        for row, subExpDir in zip(rows, subExpDirs):
+            row.update(cache.metrics[(subExpDir,) + specKey][1])
+    cache.save()
+    return pd.DataFrame(rows, index=pd.MultiIndex.from_tuples(index, names=['expId', 'subExpId']))
+
+def query(table, where=None, sort=None, top=None, columns=None):
+    """
+    Filter table with a pandas query expression (eg "lr < 0.05 and loss_min < 1.2"),
+    sort by comma separated columns (col:desc for descending), keep the top rows and selected columns.
+    """
+    if where:
+        try:
+            table = table.query(where)
+        except Exception as e: # pandas raises all kinds, eg SyntaxError or UndefinedVariableError
+            raise ValueError("Invalid -where expression '{}': {}: {}".format(where, type(e).__name__, e))
+    if sort:
+        keys = [s.split(':') for s in sort.split(',')]
+        _checkColumns(table, [k[0] for k in keys], '-sort')
+        table = table.sort_values([k[0] for k in keys], ascending=[len(k) == 1 or k[1] != 'desc' for k in keys])
+    if top:
+        table = table.head(top)
+    if columns:
+        _checkColumns(table, columns.split(','), '-cols')
+        table = table[columns.split(',')]
+    return table
+
+def _checkColumns(table, names, option):
+    unknown = [name for name in names if name not in table.columns]
+    if unknown:
+        raise ValueError("Unknown column(s) {} in {}, columns are: {}".format(', '.join(unknown), option, ', '.join(map(str, table.columns))))
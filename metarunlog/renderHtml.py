@@ -4,8 +4,11 @@
 # Defines HtmlFile and helper functions to build up the index.html from mrl_analyze functions output.
 
 import os
+import re
+import shutil
 import subprocess
 from os.path import join
+from collections import OrderedDict
 import numpy as np
 import markdown
 import bokeh
@@ -17,37 +20,252 @@ bokehCdn = """<script src="http://cdn.pydata.org/bokeh/release/bokeh-{0}.min.js"
 <link href="http://cdn.pydata.org/bokeh/release/bokeh-widgets-{0}.min.css" rel="stylesheet" type="text/css">"""\
         .format(bokeh.__version__)
 
+# lazy mode: bokeh plots run their script and tables load their JSON when scrolled into view
+lazyJs = """<script type="text/javascript">
+(function() {
+  function esc(v) { return v === null ? 'NaN' : [].concat(v).join(' '); }
+  function showPage(el, t, page) {
+    var n = +el.getAttribute('data-pagesize'), npages = Math.ceil(t.data.length / n);
+    var h = ['<table border="1" class="dataframe"><thead><tr><th></th>'];
+    for (var j = 0; j < t.columns.length; j++) h.push('<th>' + esc(t.columns[j]) + '</th>');
+    h.push('</tr></thead><tbody>');
+    for (var i = page * n; i < Math.min((page + 1) * n, t.data.length); i++) {
+      h.push('<tr><th>' + esc(t.index[i]) + '</th>');
+      for (var j = 0; j < t.data[i].length; j++) h.push('<td>' + esc(t.data[i][j]) + '</td>');
+      h.push('</tr>');
+    }
+    h.push('</tbody></table><p><button class="mrl-prev">previous</button> rows ' + (page * n + 1) + ' - ' +
+        Math.min((page + 1) * n, t.data.length) + ' of ' + t.data.length + ' <button class="mrl-next">next</button></p>');
+    el.innerHTML = h.join('');
+    var prev = el.querySelector('.mrl-prev'), next = el.querySelector('.mrl-next');
+    prev.disabled = page == 0;
+    next.disabled = page >= npages - 1;
+    prev.onclick = function() { showPage(el, t, page - 1); };
+    next.onclick = function() { showPage(el, t, page + 1); };
+  }
+  function loadTable(el) {
+    var url = el.getAttribute('data-src'), xhr = new XMLHttpRequest();
+    xhr.open('GET', url);
+    xhr.onload = function() {
+      if (xhr.status != 200 && xhr.status != 0) { el.textContent = 'failed to load ' + url; return; }
+      showPage(el, JSON.parse(xhr.responseText), 0);
+    };
+    xhr.onerror = function() { el.textContent = 'failed to load ' + url + ', serve the report over http (mrl serve)'; };
+    xhr.send();
+  }
+  function activate(el) {
+    if (el.classList.contains('mrl-table')) return loadTable(el);
+    var code = el.querySelector('script[type="text/x-mrl-lazy"]'), s = document.createElement('script');
+    s.text = code.text;
+    el.appendChild(s);
+    el.style.minHeight = '';
+  }
+  document.addEventListener('DOMContentLoaded', function() {
+    var els = document.querySelectorAll('.mrl-lazy');
+    if (!('IntersectionObserver' in window)) { for (var i = 0; i < els.length; i++) activate(els[i]); return; }
+    var obs = new IntersectionObserver(function(entries) {
+      entries.forEach(function(e) { if (e.isIntersecting) { obs.unobserve(e.target); activate(e.target); } });
+    }, {rootMargin: '500px'});
+    for (var i = 0; i < els.length; i++) obs.observe(els[i]);
+  });
+})();
+</script>"""
+thumbExts = ['.png', '.jpg', '.jpeg', '.gif']
+thumbDir = 'thumbs' # inside the analysis outdir
+
+def makeThumbnail(src, dst, width):
+    """ Scale image src down to width into dst, unless dst is up to date. Images not wider than width are copied as they are. """
+    if os.path.exists(dst) and os.stat(dst).st_mtime >= os.stat(src).st_mtime:
+        return
+    if not os.path.isdir(os.path.dirname(dst)):
+        try:
+            os.makedirs(os.path.dirname(dst))
+        except OSError: # made by another worker
+            if not os.path.isdir(os.path.dirname(dst)): raise
+    tmpfn = join(os.path.dirname(dst), '.{}.tmp.{}'.format(os.getpid(), os.path.basename(dst))) # keeps the extension
+    try:
+        from PIL import Image
+        im = Image.open(src)
+        if im.size[0] > width:
+            fmt = im.format
+            im.thumbnail((width, im.size[1] * width // im.size[0] + 1), Image.ANTIALIAS)
+            im.save(tmpfn, format=fmt)
+        else:
+            shutil.copyfile(src, tmpfn)
+    except ImportError:
+        import matplotlib.image
+        w = matplotlib.image.imread(src).shape[1]
+        if w > width:
+            matplotlib.image.thumbnail(src, tmpfn, scale=float(width) / w)
+        else:
+            shutil.copyfile(src, tmpfn)
+    os.rename(tmpfn, dst)
+
+class HtmlPage:
+    """
+    One html output file. The body is either kept as a list of chunks,
+    or streamed to a temporary file next to fn. finalize() writes the actual page.
+    """
+    def __init__(self, fn, stream):
+        self.fn = fn
+        self.hasBokeh = False
+        self.hasLazy = False
+        self.subExpIds = []
+        self.chunks = None if stream else []
+        self.fh = open(fn + '.body.tmp', 'w') if stream else None
+
+    def write(self, s):
+        if self.fh:
+            self.fh.write(s)
+        else:
+            self.chunks.append(s)
+
+    def finalize(self, title, nav='', footer=''):
+        """ Write head, nav, body and footer to fn, atomically. """
+        tmpfn = self.fn + '.tmp'
+        with open(tmpfn, 'w') as fh:
+            head = '<title>{}</title>\n{}\n{}\n'.format(title, bokehCdn if self.hasBokeh else '', lazyJs if self.hasLazy else '')
+            fh.write('<!DOCTYPE html>\n <html>\n<head>\n{}\n</head>\n\n'.format(head))
+            fh.write('<body>{}'.format(nav))
+            if self.fh:
+                self.fh.close()
+                with open(self.fh.name) as bodyfh:
+                    shutil.copyfileobj(bodyfh, fh)
+                os.remove(self.fh.name)
+            else:
+                fh.write(''.join(self.chunks))
+            fh.write('{}</body>\n\n'.format(footer))
+            fh.write('</html>\n')
+        os.rename(tmpfn, self.fn)
+
 class HtmlFile:
+    """
+    Html report built up from the mrl_analyze functions output.
+    Without fn the body is kept in memory until render(fn).
+    With fn the body is streamed to disk as it is produced.
+    With pageSize, the subExp sections (see addSubExpSection) are split over
+    extra pages of pageSize subExps each, and fn becomes the overview page
+    with a navigation index to these pages.
+    With lazy (needs fn), the report loads incrementally: plots are shown as thumbnails
+    (made by a pool of jobs processes) and lazy-loaded images, bokeh plots initialize
+    when scrolled into view, and tables longer than tableRows are written to JSON files
+    next to fn and shown tableRows rows per page.
+    """
     # TODO use jinja templating here
-    def __init__(self):
-        self.body = ""
+    def __init__(self, fn=None, pageSize=None, lazy=False, jobs=1, thumbWidth=400, tableRows=100):
+        if lazy and not fn:
+            raise Exception("HtmlFile needs fn at construction for lazy mode")
+        self.fn = fn
+        self.pageSize = pageSize
+        self.lazy = lazy
+        self.jobs = jobs
+        self.thumbWidth = thumbWidth
+        self.tableRows = tableRows
+        self.thumbPool = None
+        self.thumbResults = [] # (plotfn, AsyncResult)
+        self.nTables = 0
         self.title = ""
-        self.bokehScripts = ""
+        self.overview = HtmlPage(fn, True) if fn else HtmlPage(None, False)
+        self.pages = [] # subExp pages, when pageSize
+        self.page = self.overview # page currently written to
+        self.nSubExps = 0
+
+    def _write(self, s):
+        self.page.write(s)
     def addTitle(self, title):
         self.title = title
-        self.body += "<h1>{}</h1>\n".format(title)
+        self._write("<h1>{}</h1>\n".format(title))
     def addHeader(self, hdr, level=1, anchor=None):
         if anchor:
             hdr = '<a name="{}">{}</a>'.format(anchor, hdr)
-        self.body += "<h{level}>{hdr}</h{level}>\n".format(level=level, hdr=hdr)
+        self._write("<h{level}>{hdr}</h{level}>\n".format(level=level, hdr=hdr))
+    def addSubExpSection(self, subExpId):
+        """ Start the section of a subExp, on a new page every pageSize subExps. """
+        if self.pageSize and self.nSubExps % self.pageSize == 0:
+            if not self.fn:
+                raise Exception("HtmlFile needs fn at construction to split into pages")
+            base, ext = os.path.splitext(self.fn)
+            self.page = HtmlPage('{}_p{:03d}{}'.format(base, len(self.pages)+1, ext), True)
+            self.pages.append(self.page)
+            self._write("<h1>{}</h1>\n".format(self.title))
+        self.page.subExpIds.append(subExpId)
+        self.nSubExps += 1
+        self.addHeader('{} - {}'.format('subExp', subExpId), 1, subExpId)
     def addParagraph(self, txt):
-        self.body += "<p>{}</p>\n".format(txt)
+        self._write("<p>{}</p>\n".format(txt))
     def parseNote(self, notePath, v=True):
+        from metarunlog.archive import openFile
         try:
-            with open(notePath) as fh:
-                self.body += markdown.markdown(fh.read())+'\n'
+            with openFile(notePath) as fh: # also from an archived expDir
+                self._write(markdown.markdown(fh.read())+'\n')
             if v: print "Parsed note {}".format(notePath)
         except IOError as e:
             print "Didn't find note {}".format(notePath)
 
-    def render(self, fn, v=True):
-        with open(fn, 'w') as fh:
-            head = '<title>{}</title>\n{}\n{}\n'.format(
-                    self.title, bokehCdn if self.bokehScripts else '', self.bokehScripts)
-            fh.write('<!DOCTYPE html>\n <html>\n<head>\n{}\n</head>\n\n'.format(head))
-            fh.write('<body>{}</body>\n\n'.format(self.body))
-            fh.write('</html>\n')
-        if v: print "Wrote output to {}".format(fn)
+    def _pageLabel(self, page):
+        return 'subExps {} - {}'.format(page.subExpIds[0], page.subExpIds[-1])
+
+    def _nav(self, current):
+        """ Navigation bar for page current (None: the index at the end of the overview page). """
+        if not self.pages:
+            return ''
+        fn = lambda page: os.path.basename(page.fn)
+        if current is None:
+            items = ['<li><a href="{}">{}</a>: {}</li>'.format(fn(page), self._pageLabel(page),
+                ' '.join('<a href="{}#{}">{}</a>'.format(fn(page), s, s) for s in page.subExpIds))
+                for page in self.pages]
+            return '<h1>subExp pages</h1>\n<ul>\n{}\n</ul>\n'.format('\n'.join(items))
+        i = self.pages.index(current)
+        links = ['<a href="{}">overview</a>'.format(os.path.basename(self.fn))]
+        if i > 0: links.append('<a href="{}">previous</a>'.format(fn(self.pages[i-1])))
+        if i < len(self.pages)-1: links.append('<a href="{}">next</a>'.format(fn(self.pages[i+1])))
+        return '<p>{}</p>\n'.format(' | '.join(links))
+
+    def _thumbnail(self, plotfn):
+        """ Relative path of the thumbnail of plotfn, made in the background; None if plotfn gets none. """
+        if os.path.splitext(plotfn)[1].lower() not in thumbExts or os.path.isabs(plotfn) or ':' in plotfn:
+            return None
+        if self.thumbPool is None:
+            import multiprocessing
+            self.thumbPool = multiprocessing.Pool(max(self.jobs, 1))
+        outdir = os.path.dirname(self.fn)
+        thumb = '{}/{}'.format(thumbDir, plotfn)
+        self.thumbResults.append((plotfn, self.thumbPool.apply_async(makeThumbnail,
+            (join(outdir, plotfn), join(outdir, thumb), self.thumbWidth))))
+        return thumb
+
+    def _finishThumbnails(self):
+        if self.thumbPool is None: return
+        self.thumbPool.close()
+        self.thumbPool.join()
+        for plotfn, result in self.thumbResults:
+            try:
+                result.get()
+            except Exception as e: # the page falls back to the full image
+                print "No thumbnail for {}: {}: {}".format(plotfn, type(e).__name__, e)
+        self.thumbPool, self.thumbResults = None, []
+
+    def _img(self, plotfn):
+        """ img tag for plotfn; in lazy mode its thumbnail, falling back to plotfn if the thumbnail is missing. """
+        if not self.lazy:
+            return '<img src="{}"></img>'.format(plotfn)
+        thumb = self._thumbnail(plotfn)
+        if not thumb:
+            return '<img src="{}" loading="lazy"></img>'.format(plotfn)
+        return '<img src="{}" loading="lazy" onerror="this.onerror=null;this.src=\'{}\'"></img>'.format(thumb, plotfn)
+
+    def render(self, fn=None, v=True):
+        self._finishThumbnails()
+        fn = fn or self.fn
+        if not self.fn:
+            self.overview.fn = fn
+        elif fn != self.fn:
+            raise Exception("HtmlFile streams to {}, can't render to {}".format(self.fn, fn))
+        for page in self.pages:
+            page.finalize('{} - {}'.format(self.title, self._pageLabel(page)), self._nav(page))
+        self.overview.finalize(self.title, footer=self._nav(None))
+        if v: print "Wrote output to {}{}".format(fn,
+                " and {} subExp pages".format(len(self.pages)) if self.pages else "")
 
     def addRetVal(self, retval):
         if not retval: #None or empty list
@@ -62,22 +280,171 @@ class HtmlFile:
                 raise Exception("Unknown rtype {}".format(rtype))
 
     def addHtml(self, htmlString):
-        self.body += htmlString
+        self._write(htmlString)
     def addPlot(self, plotfn):
-        self.addParagraph('<img src="{}"></img>\n'.format(plotfn))
+        if self.lazy:
+            self.addParagraph('<a href="{}">{}</a>\n'.format(plotfn, self._img(plotfn)))
+        else:
+            self.addParagraph(self._img(plotfn) + '\n')
     def addTable(self, table): 
+        if self.lazy and len(table) > self.tableRows:
+            self.nTables += 1
+            fn = '{}_t{:04d}.json'.format(os.path.splitext(os.path.basename(self.fn))[0], self.nTables)
+            path = join(os.path.dirname(self.fn), fn)
+            table.to_json(path + '.tmp', orient='split')
+            os.rename(path + '.tmp', path)
+            self.page.hasLazy = True
+            self._write('<div class="mrl-lazy mrl-table" data-src="{}" data-pagesize="{}">table of {} rows</div>\n'.format(
+                fn, self.tableRows, len(table)))
+            return
         self.addParagraph(table.to_html(escape=False))
     def addText(self, text):
-        self.body += markdown.markdown(text)
+        self._write(markdown.markdown(text))
     def addMp4(self, videofn):
-        self.body += '<div>\n<video preload="none" controls>\n'
-        self.body += '<source src="{}" type="video/mp4; codecs="avc1.42E01E, mp4a.40.2"">'.format(videofn)
-        self.body += '</video>\n</div>\n'
+        self._write('<div>\n<video preload="none" controls>\n')
+        self._write('<source src="{}" type="video/mp4; codecs="avc1.42E01E, mp4a.40.2"">'.format(videofn))
+        self._write('</video>\n</div>\n')
     def addBokeh(self, bokehPlot):
-        script, div = components(bokehPlot)
-        self.bokehScripts += script + '\n'
-        self.body += div + '\n'
+        """ bokehPlot: a bokeh plot or layout, or its (script, div) components as bokehLines returns. """
+        # script right after its div: bokeh runs it once the document is loaded
+        script, div = bokehPlot if isinstance(bokehPlot, tuple) else components(bokehPlot)
+        self.page.hasBokeh = True
+        code = re.match(r'\s*<script[^>]*>(.*)</script>\s*$', script, re.S) if self.lazy else None
+        if code: # run by lazyJs once in view; min-height so not all empty plots are in view at once
+            self.page.hasLazy = True
+            self._write('<div class="mrl-lazy" style="min-height: 300px">\n{}\n<script type="text/x-mrl-lazy">{}</script>\n</div>\n'.format(
+                div, code.group(1)))
+            return
+        self._write(div + '\n' + script + '\n')
     def addPlotlinkbokeh(self, rdata):
         plotfn, bokehfn = rdata
-        self.addParagraph('<a href="{}"><img src="{}"></img></a>\n'.format(
-            bokehfn, plotfn))
+        self.addParagraph('<a href="{}">{}</a>\n'.format(bokehfn, self._img(plotfn)))
+
+#### Plotting helpers for mrl_analyze functions: long metric series are downsampled before they are embedded.
+
+def lttbIndices(x, y, n):
+    """
+    Indices of n points of (x, y) picked by Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+    the first and last point, and per bucket the point forming the largest triangle with the
+    previous pick and the mean of the next bucket. Vectorized within each bucket.
+    """
+    N = len(y)
+    if n >= N or n < 3:
+        return np.arange(N)
+    edges = np.linspace(1, N - 1, n - 1).astype(int) # n-2 non-empty buckets over the points 1 .. N-2
+    counts = np.diff(edges)
+    nextX = np.append(np.add.reduceat(x[:N-1], edges[:-1])[1:] / counts[1:], x[-1])
+    nextY = np.append(np.add.reduceat(y[:N-1], edges[:-1])[1:] / counts[1:], y[-1])
+    picked = np.empty(n, dtype=int)
+    picked[0], picked[-1] = 0, N - 1
+    a = 0
+    for i in xrange(n - 2):
+        lo, hi = edges[i], edges[i+1]
+        area = np.abs((x[a] - nextX[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (nextY[i] - y[a]))
+        a = lo + int(area.argmax())
+        picked[i+1] = a
+    return picked
+
+def minmaxIndices(y, n):
+    """ Indices of the first, last, and the min and max point of n/2 equal buckets of y. """
+    N = len(y)
+    nb = max(n // 2 - 1, 1)
+    size = N // nb
+    if n >= N or size < 2:
+        return np.arange(N)
+    buckets = y[:nb * size].reshape(nb, size)
+    offsets = np.arange(nb) * size
+    idx = [[0, N - 1], offsets + buckets.argmin(1), offsets + buckets.argmax(1)]
+    if nb * size < N: # remainder bucket
+        tail = y[nb * size:]
+        idx.append([nb * size + tail.argmin(), nb * size + tail.argmax()])
+    return np.unique(np.concatenate(idx))
+
+def downsampleIndices(x, columns, n, method='lttb'):
+    """
+    Sorted row indices that keep the shape of every column in columns (list of arrays, NaN allowed) with
+    about n points each: the union of the per column picks, so all columns can share one data source.
+    """
+    N = len(x)
+    keep = [np.array([0, N - 1]) if N else np.zeros(0, dtype=int)]
+    for y in columns:
+        y = np.asarray(y, dtype=float)
+        finite = np.flatnonzero(np.isfinite(y))
+        if len(finite) <= n:
+            keep.append(finite)
+        elif method == 'lttb':
+            keep.append(finite[lttbIndices(x[finite], y[finite], n)])
+        elif method == 'minmax':
+            keep.append(finite[minmaxIndices(y[finite], n)])
+        else:
+            raise ValueError("Unknown downsampling method {}".format(method))
+    return np.unique(np.concatenate(keep)).astype(int)
+
+fullResJs = """
+var xhr = new XMLHttpRequest();
+xhr.open('GET', url);
+xhr.onload = function() {
+    if (xhr.status != 200 && xhr.status != 0) { button.label = 'failed to load ' + url; return; }
+    var data = JSON.parse(xhr.responseText);
+    for (var k in data) data[k] = data[k].map(function(v) { return v === null ? NaN : v; });
+    source.data = data;
+    button.label = 'full resolution (' + data[xcol].length + ' points)';
+    button.disabled = true;
+};
+xhr.send();
+"""
+
+def bokehLines(data, x=None, ys=None, maxPoints=None, method=None, outdir=None, name=None,
+        width=700, height=300, title=None):
+    """
+    Bokeh line plots of the columns of data (DataFrame, or dict of arrays like metrics.load returns),
+    as (script, div) for rtype 'bokeh': strings, unlike bokeh models these can be pickled (analyze -j, analysis cache).
+    ys: list of figures, each a column name or list of column names (default: all columns in one figure).
+    x: column name, default the DataFrame index or the row number.
+    All figures share one ColumnDataSource, downsampled to about maxPoints per column (default cfg.analysis_maxPoints)
+    with method 'lttb' or 'minmax' (default cfg.analysis_downsample).
+    With outdir and name, the full data is written to outdir/name.json and a button loads it into the plots
+    (needs the report served over http, eg with mrl serve).
+    """
+    import json
+    from bokeh.plotting import figure
+    from bokeh.models import ColumnDataSource, Button, CustomJS
+    from bokeh.layouts import column
+    from bokeh.palettes import Category10_10
+    from metarunlog import cfg
+    maxPoints = maxPoints or cfg.analysis_maxPoints
+    method = method or cfg.analysis_downsample
+    cols = OrderedDict((str(k), np.asarray(data[k], dtype=float)) for k in data.keys())
+    xcol = x or 'index'
+    if x is None:
+        cols[xcol] = np.asarray(data.index, dtype=float) if hasattr(data, 'index') else \
+                np.arange(len(cols.values()[0]) if cols else 0, dtype=float)
+    ys = ys or [[k for k in cols if k != xcol]]
+    ys = [[y] if isinstance(y, basestring) else list(y) for y in ys]
+    used = [xcol] + sorted(set(y for fig in ys for y in fig))
+    keep = downsampleIndices(cols[xcol], [cols[y] for y in used[1:]], maxPoints, method)
+    downsampled = len(keep) < len(cols[xcol])
+    source = ColumnDataSource({k: cols[k][keep] for k in used})
+    figures = []
+    for fig in ys:
+        p = figure(plot_width=width, plot_height=height, title=title if not figures else None,
+                x_range=figures[0].x_range if figures else None, tools='pan,box_zoom,wheel_zoom,reset,save')
+        for color, y in zip(Category10_10 * (len(fig) // 10 + 1), fig):
+            p.line(xcol, y, source=source, color=color, legend_label=y)
+        p.legend.click_policy = 'hide'
+        p.xaxis.axis_label = xcol
+        figures.append(p)
+    if downsampled and outdir and name:
+        fn = name + '.json'
+        full = {}
+        for k in used: # JSON has no NaN or inf: null
+            vals = cols[k].astype(object)
+            vals[~np.isfinite(cols[k])] = None
+            full[k] = vals.tolist()
+        with open(join(outdir, fn + '.tmp'), 'w') as fh:
+            json.dump(full, fh, separators=(',', ':'), allow_nan=False)
+        os.rename(join(outdir, fn + '.tmp'), join(outdir, fn))
+        button = Button(label='full resolution ({} of {} points shown)'.format(len(keep), len(cols[xcol])), width=width)
+        button.js_on_click(CustomJS(args=dict(source=source, button=button, url=fn, xcol=xcol), code=fullResJs))
+        figures.append(button)
+    return components(column(*figures))
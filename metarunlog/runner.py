@@ -0,0 +1,109 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Local job runner for mrl run: a queue of subExp commands executed with a bounded number
+# of concurrent slots per host. Remote hosts are reached over ssh with connection multiplexing,
+# stdout/stderr of every job are captured into its subExp dir and the exit code is recorded.
+
+import os
+import sys
+import time
+import json
+import subprocess
+from collections import deque, OrderedDict
+from os.path import join
+
+from metarunlog import profiler
+from metarunlog.util import sshify, nowstring
+
+localHosts = ['', 'local', 'localhost']
+
+class Job:
+    def __init__(self, subExpId, subExpDir, cmd):
+        self.subExpId  = subExpId
+        self.subExpDir = subExpDir
+        self.cmd       = cmd
+        self.host      = None
+        self.exitcode  = None
+        self.start     = None
+        self.started   = None
+        self.duration  = None
+
+def parseHosts(hostsArg):
+    """ 'localhost:4,gpu1:2' -> OrderedDict {host: slots}, slots default to 1. """
+    hosts = OrderedDict()
+    for item in hostsArg.split(','):
+        host, slots = item.rsplit(':', 1) if ':' in item else (item, 1)
+        hosts[host] = int(slots)
+    return hosts
+
+class Scheduler:
+    """
+    Runs jobs from a FIFO queue, at most hosts[host] at the same time on each host.
+    Every job writes run.stdout, run.stderr and .mrl.run (host, command, times, exit code)
+    to its subExp dir, and .mrl.done when it exits with code 0.
+    """
+    def __init__(self, hosts, sshOptions='', sshPass=None, vfh=sys.stdout):
+        self.hosts      = hosts
+        self.sshOptions = sshOptions
+        self.sshPass    = sshPass
+        self.vfh        = vfh
+
+    def _start(self, job, host):
+        if host in localHosts:
+            cmd = job.cmd
+        else:
+            cmd = sshify(job.cmd, host, self.sshPass, sshOptions=self.sshOptions)
+        job.host, job.start, job.started = host, time.time(), nowstring()
+        if os.path.exists(join(job.subExpDir, '.mrl.done')): os.remove(join(job.subExpDir, '.mrl.done'))
+        with open(join(job.subExpDir, 'run.stdout'), 'w') as out, open(join(job.subExpDir, 'run.stderr'), 'w') as err:
+            proc = subprocess.Popen(cmd, shell=True, cwd=job.subExpDir, stdout=out, stderr=err, close_fds=True)
+        self._writeState(job)
+        return proc
+
+    def _finish(self, job, status):
+        job.duration = time.time() - job.start
+        job.exitcode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        self._writeState(job)
+        if job.exitcode == 0:
+            open(join(job.subExpDir, '.mrl.done'), 'w').close()
+        profiler.record('run ' + job.subExpId, job.start, job.duration, 0., cat='job', args={'host': job.host})
+
+    def _writeState(self, job):
+        state = {'host': job.host, 'cmd': job.cmd, 'started': job.started,
+                'duration': job.duration, 'exitcode': job.exitcode}
+        with open(join(job.subExpDir, '.mrl.run'), 'w') as fh:
+            json.dump(state, fh, indent=2)
+            fh.write('\n')
+
+    def run(self, jobs):
+        """ Run all jobs, returns them with exitcode and duration filled in. """
+        queue   = deque(jobs)
+        free    = OrderedDict(self.hosts)
+        running = {} # pid -> (proc, job)
+        ndone   = 0
+        try:
+            while queue or running:
+                for host in free:
+                    while free[host] and queue:
+                        job = queue.popleft()
+                        proc = self._start(job, host)
+                        running[proc.pid] = (proc, job)
+                        free[host] -= 1
+                if not running:
+                    raise ValueError("No slots to run jobs on, check the hosts")
+                pid, status = os.waitpid(-1, 0)
+                if pid not in running: continue
+                proc, job = running.pop(pid)
+                proc.returncode = status # reaped here, keep Popen from waiting on it again
+                self._finish(job, status)
+                free[job.host] += 1
+                ndone += 1
+                self.vfh.write('[{}/{}] {} exit {} on {} after {:.1f}s ({} running, {} queued)\n'.format(
+                    ndone, len(jobs), job.subExpId, job.exitcode, job.host or 'localhost', job.duration,
+                    len(running), len(queue)))
+                self.vfh.flush()
+        except KeyboardInterrupt:
+            for proc, job in running.values():
+                proc.terminate()
+            raise
+        return jobs
@@ -0,0 +1,202 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# mrl serve: threaded HTTP server over the outdir for the analysis reports.
+# Compared to python -m SimpleHTTPServer: one thread per request, keep-alive, gzip for text
+# (compressed once per file version and kept in memory), ETag / Last-Modified with 304 responses,
+# and single byte ranges so the mp4s of HtmlFile.addMp4 can be seeked.
+# An optional onRequest(relpath) callback runs before a file is served (on-demand analyze).
+
+import os
+import zlib
+import socket
+import threading
+import posixpath
+import urllib
+from os.path import join, isdir
+from collections import OrderedDict
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+compressTypes = ['text/html', 'text/css', 'text/plain', 'text/csv', 'application/javascript',
+        'application/json', 'image/svg+xml']
+minCompressSize = 1024
+blockSize = 1 << 16
+
+class GzipCache:
+    """ Gzipped bodies keyed on (path, mtime, size), least recently used dropped past maxBytes. """
+    def __init__(self, maxBytes=64 << 20):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, st, fh):
+        key = (path, st.st_mtime, st.st_size)
+        with self._lock:
+            body = self.entries.pop(key, None)
+            if body is not None:
+                self.entries[key] = body
+                return body
+        z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+        body = ''.join([z.compress(block) for block in iter(lambda: fh.read(blockSize), '')]) + z.flush()
+        with self._lock:
+            if key not in self.entries and len(body) <= self.maxBytes:
+                self.entries[key] = body
+                self.size += len(body)
+                while self.size > self.maxBytes:
+                    self.size -= len(self.entries.popitem(last=False)[1])
+        return body
+
+def parseRange(header, size):
+    """ (start, end) inclusive of a single 'bytes=' range, None to ignore the header, () if unsatisfiable. """
+    if not header or not header.startswith('bytes=') or ',' in header: return None
+    start, sep, end = header[len('bytes='):].strip().partition('-')
+    try:
+        if not start: # suffix: the last end bytes
+            n = int(end)
+            return (max(size - n, 0), size - 1) if n > 0 and size > 0 else ()
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start: return ()
+    return start, end
+
+class ReportHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive: every response has a Content-Length
+    server_version = 'mrl-serve'
+    extensions_map = dict(SimpleHTTPRequestHandler.extensions_map, **{
+        '.mp4': 'video/mp4', '.webm': 'video/webm', '.svg': 'image/svg+xml', '.json': 'application/json',
+        '.js': 'application/javascript', '.csv': 'text/csv', '.log': 'text/plain'})
+
+    def translate_path(self, path):
+        """ Path under the served root, '..' and absolute parts dropped. """
+        path = urllib.unquote(path.split('?', 1)[0].split('#', 1)[0])
+        parts = [p for p in posixpath.normpath(path).split('/') if p not in ('', os.curdir, os.pardir)]
+        return join(self.server.root, *parts)
+
+    def do_GET(self):
+        self._serve(True)
+
+    def do_HEAD(self):
+        self._serve(False)
+
+    def _serve(self, withBody):
+        path = self.translate_path(self.path)
+        if self.server.onRequest:
+            try:
+                self.server.onRequest(os.path.relpath(path, self.server.root))
+            except Exception as e:
+                self.log_error('onRequest failed for %s: %s: %s', self.path, type(e).__name__, e)
+        if isdir(path):
+            urlPath = self.path.split('?', 1)[0]
+            if not urlPath.endswith('/'):
+                self.send_response(301)
+                self.send_header('Location', urlPath + '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if not os.path.isfile(join(path, 'index.html')):
+                f = self.list_directory(path) # sends its own headers, with Content-Length
+                if f:
+                    if withBody: self._copy(f, None)
+                    f.close()
+                return
+            path = join(path, 'index.html')
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            self.send_error(404, 'File not found')
+            return
+        try:
+            st = os.fstat(fh.fileno())
+            self._serveFile(path, fh, st, withBody)
+        finally:
+            fh.close()
+
+    def _serveFile(self, path, fh, st, withBody):
+        ctype = self.guess_type(path)
+        etag = '"{:x}-{:x}"'.format(int(st.st_mtime * 1e6), st.st_size)
+        lastModified = self.date_time_string(int(st.st_mtime))
+        rangeHeader = self.headers.getheader('Range')
+        gzip = ctype in compressTypes and st.st_size >= minCompressSize and not rangeHeader and \
+                'gzip' in self.headers.getheader('Accept-Encoding', '')
+        if gzip: etag = etag[:-1] + '-gz"'
+        if self._notModified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        ifRange = self.headers.getheader('If-Range')
+        byteRange = parseRange(rangeHeader, st.st_size) if not ifRange or ifRange in (etag, lastModified) else None
+        if byteRange == ():
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(st.st_size))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.server.gzipCache.get(path, st, fh) if gzip else None
+        self.send_response(206 if byteRange else 200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', lastModified)
+        self.send_header('Cache-Control', 'no-cache') # reports change in place: always revalidate, cheap with the ETag
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzip:
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+        elif byteRange:
+            start, end = byteRange
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, st.st_size))
+            self.send_header('Content-Length', str(end - start + 1))
+        else:
+            self.send_header('Content-Length', str(st.st_size))
+        self.end_headers()
+        if not withBody: return
+        if gzip:
+            self._write(body)
+        elif byteRange:
+            fh.seek(byteRange[0])
+            self._copy(fh, byteRange[1] - byteRange[0] + 1)
+        else:
+            self._copy(fh, None)
+
+    def _notModified(self, etag, mtime):
+        """ Conditional GET: If-None-Match takes precedence over If-Modified-Since. """
+        ifNoneMatch = self.headers.getheader('If-None-Match')
+        if ifNoneMatch:
+            return ifNoneMatch.strip() == '*' or etag in [t.strip() for t in ifNoneMatch.split(',')]
+        ifModifiedSince = self.headers.getheader('If-Modified-Since')
+        if ifModifiedSince:
+            from email.utils import parsedate_tz, mktime_tz
+            parsed = parsedate_tz(ifModifiedSince)
+            return parsed is not None and int(mtime) <= mktime_tz(parsed)
+        return False
+
+    def _copy(self, fh, length):
+        while length is None or length > 0:
+            block = fh.read(blockSize if length is None else min(blockSize, length))
+            if not block: break
+            if not self._write(block): break
+            if length is not None: length -= len(block)
+
+    def _write(self, data):
+        try:
+            self.wfile.write(data)
+            return True
+        except socket.error: # client went away, eg seeking in a video
+            self.close_connection = 1
+            return False
+
+class ReportServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, root, onRequest=None):
+        HTTPServer.__init__(self, address, ReportHandler)
+        self.root = os.path.abspath(root)
+        self.onRequest = onRequest
+        self.gzipCache = GzipCache()
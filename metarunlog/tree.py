@@ -0,0 +1,185 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Python API over the experiment tree: Experiment and SubExperiment objects, obtained from
+# MetaRunLog.exp(expId) / MetaRunLog.experiments(), that load their facts on first access
+# and keep them until invalidate(). The mrl subcommands are built on the same objects.
+#
+#   mrl = metarunlog.MetaRunLog(basedir)
+#   for exp in mrl.experiments():
+#       print exp.name, exp.conf['description'], len(exp), exp.done
+#       for subExp in exp:
+#           print subExp.subExpId, subExp.params, subExp.done
+
+import os
+import json
+from os.path import join, isfile
+from collections import OrderedDict
+
+from metarunlog import cfg
+from metarunlog import archive
+
+def listSubExps(dirpath):
+    """ Sorted names of the subExp directories in dirpath (names that are formatted subExp ids). """
+    subExps = []
+    for name in archive.listdir(dirpath): # includes the subExps of an archived expDir
+        try:
+            if cfg.subExpFormat.format(subExpId=int(name)) == name:
+                subExps.append(str(name))
+        except ValueError:
+            pass
+    return subExps
+
+def loadDotMrl(subExpDir):
+    """ Contents of subExpDir/.mrl, with str instead of unicode strings. """
+    from metarunlog.util import _decode_hook, jsonErrorMsg
+    try:
+        with archive.openFile(join(subExpDir, '.mrl')) as fh:
+            return json.load(fh, object_hook=_decode_hook)
+    except (IOError, KeyError) as e: # dummy
+        return {'subExpDir': subExpDir, 'params':{}}
+    except ValueError as e:
+        raise type(e)('Failed to load .mrl file for subExp {} \n{}'.format(subExpDir, jsonErrorMsg(join(subExpDir, '.mrl'), e)))
+
+class Experiment(object):
+    """
+    Experiment directory outdir/name. conf (its .mrl), subExpIds and done come from the
+    experiment index, params from the manifest. All are memoized: call invalidate() after
+    changing the experiment on disk (makebatch does this itself).
+    """
+    __slots__ = ('mrl', 'expId', 'name', 'path', '_entry', '_subExps', '_params')
+
+    def __init__(self, mrl, expId):
+        self.mrl   = mrl
+        self.expId = expId
+        self.name  = mrl._fmtSingleExp(expId)
+        self.path  = join(mrl.outdir, self.name)
+        self._entry = self._subExps = self._params = None
+
+    def _getEntry(self):
+        if self._entry is None:
+            self._entry = self.mrl.index.get(self.name, self._loadEntry)
+        return self._entry
+
+    def _loadEntry(self):
+        with archive.openFile(join(self.path, '.mrl')) as fh:
+            conf = json.JSONDecoder(object_pairs_hook=OrderedDict).decode(fh.read())
+        return conf, listSubExps(self.path), archive.isfile(join(self.path, '.mrl.done'))
+
+    @property
+    def conf(self):
+        return self._getEntry()['conf']
+
+    @property
+    def subExpIds(self):
+        return self._getEntry()['subExps']
+
+    @property
+    def done(self):
+        return self._getEntry()['done']
+
+    @property
+    def mtime(self):
+        """ mtime of the expDir when the index entry was loaded, changes when subExps are added or removed. """
+        return self._getEntry()['mtime']
+
+    @property
+    def archived(self):
+        """ Packed by mrl archive, see archive.py. """
+        return isfile(join(self.path, archive.archiveFn))
+
+    @property
+    def subExps(self):
+        if self._subExps is None:
+            self._subExps = [SubExperiment(self, subExpId, i) for i, subExpId in enumerate(self.subExpIds)]
+        return self._subExps
+
+    def subExp(self, subExpId):
+        """ SubExperiment by id, as int or formatted string. """
+        if not isinstance(subExpId, basestring) or subExpId.isdigit():
+            subExpId = cfg.subExpFormat.format(subExpId=int(subExpId))
+        try:
+            return self.subExps[self.subExpIds.index(subExpId)]
+        except ValueError:
+            raise KeyError("No subExp {} in experiment {}".format(subExpId, self.name))
+
+    @property
+    def params(self):
+        """ List with the params of every subExp, from the manifest when it is consistent (see manifest.py). """
+        if self._params is None:
+            from metarunlog import manifest
+            params = manifest.load(self.path, self.subExpIds, cfg.manifestCheck)
+            if params is None:
+                params = [loadDotMrl(join(self.path, subExpId))['params'] for subExpId in self.subExpIds]
+            self._params = params
+        return self._params
+
+    def refreshManifest(self):
+        """ Rewrite the manifest from the .mrl files if it doesn't match them. Returns params. """
+        from metarunlog import manifest
+        if self.archived or manifest.load(self.path, self.subExpIds, cfg.manifestCheck) is not None:
+            return self.params
+        self._params = None
+        params = self.params
+        try:
+            header = manifest.readHeader(self.path)
+            manifest.write(self.path, zip(self.subExpIds, params),
+                    {'bodyHash': header['bodyHash']} if 'bodyHash' in header else None)
+        except (IOError, OSError) as e:
+            print("Could not write manifest in {}: {}".format(self.path, e))
+        return params
+
+    def paramsFrame(self):
+        """ params as pandas DataFrame indexed by subExpId. """
+        import pandas as pd
+        return pd.DataFrame(self.params, index=self.subExpIds)
+
+    def invalidate(self):
+        """ Forget the memoized facts, also in the experiment index. """
+        self._entry = self._subExps = self._params = None
+        self.mrl.index.invalidate(self.name)
+
+    def __len__(self):
+        return len(self.subExpIds)
+
+    def __iter__(self):
+        return iter(self.subExps)
+
+    def __repr__(self):
+        return 'Experiment({!r})'.format(self.path)
+
+class SubExperiment(object):
+    """ SubExp directory of an Experiment. done is not memoized, it's a live check of .mrl.done. """
+    __slots__ = ('exp', 'subExpId', 'path', 'index', '_dotmrl')
+
+    def __init__(self, exp, subExpId, index):
+        self.exp      = exp
+        self.subExpId = subExpId
+        self.path     = join(exp.path, subExpId)
+        self.index    = index # position in exp.subExpIds
+        self._dotmrl  = None
+
+    @property
+    def dotmrl(self):
+        """ Contents of the .mrl file. """
+        if self._dotmrl is None:
+            self._dotmrl = loadDotMrl(self.path)
+        return self._dotmrl
+
+    @property
+    def params(self):
+        return self.exp.params[self.index]
+
+    @property
+    def done(self):
+        return archive.isfile(join(self.path, '.mrl.done'))
+
+    def metrics(self, logfn=None, asFrame=False):
+        """ Columns of logfn from the metrics store, see metrics.load. """
+        from metarunlog import metrics
+        return metrics.load(self.path, logfn, asFrame)
+
+    def invalidate(self):
+        self._dotmrl = None
+
+    def __repr__(self):
+        return 'SubExperiment({!r})'.format(self.path)
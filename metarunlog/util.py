@@ -3,7 +3,10 @@
 # Date: 2015-01-23
 
 import datetime
-import subprocess
+import os
+import itertools
+
+FICLONE = 0x40049409 # linux ioctl, clone the extents of a file (reflink)
 
 def nowstring(sec=True, ms= False):
     tstr = datetime.datetime.now().isoformat()
@@ -13,8 +16,10 @@ def nowstring(sec=True, ms= False):
         tstr = tstr.rsplit(':',1)[0]
     return tstr
 
-def sshify(cmd, sshHost, sshPass, vfh=None):
+def sshify(cmd, sshHost, sshPass, vfh=None, sshOptions=''):
     cleancmd = ''
+    if sshHost and sshOptions: # eg ControlMaster options to reuse connections
+        sshHost = '{} {}'.format(sshOptions, sshHost)
     if sshHost:
         #cmd = 'ssh -t {} "{}"'.format(sshHost, cmd) #works but messes up terminal
         #cmd = 'ssh {} "shopt -s huponexit; {}"'.format(sshHost, cmd) # doesnt work to kill job on exit
@@ -40,6 +45,20 @@ def _decode_list(data):
         rv.append(item)
     return rv
 
+def _decode_hook(data):
+    """ object_hook version of _decode_dict: nested dicts were already decoded by the hook, so only one level. """
+    rv = {}
+    for key, value in data.iteritems():
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif isinstance(value, list):
+            value = [x.encode('utf-8') if isinstance(x, unicode) else _decode_list(x) if isinstance(x, list) else x
+                    for x in value]
+        rv[key] = value
+    return rv
+
 def _decode_dict(data):
     rv = {}
     for key, value in data.iteritems():
@@ -54,9 +73,56 @@ def _decode_dict(data):
         rv[key] = value
     return rv
 
+def jsonErrorMsg(fn, e):
+    """ Error message for json file fn that failed to parse with ValueError e.
+    Re-parses with simplejson if available, which has way better error messaging. """
+    try:
+        import simplejson
+        with open(fn) as fh:
+            simplejson.load(fh)
+    except ImportError:
+        pass
+    except ValueError as e2:
+        return str(e2)
+    return str(e)
+
 def get_commit():
+    import subprocess
     cline = subprocess.check_output("git log -n1 --oneline", shell=True)
     #print "cline: ", cline
     cline = cline.split()
     return (cline[0], " ".join(cline[1:]))
 
+
+def copyFile(src, dst, mode='copy'):
+    """
+    Copy src to dst, or with mode 'hardlink' / 'reflink' share the data with src.
+    Falls back to a regular copy if the filesystem doesn't support linking.
+    """
+    import shutil
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        import fcntl
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copymode(src, dst)
+            return
+        except (IOError, OSError):
+            pass
+    elif mode != 'copy':
+        raise ValueError("Unknown copy mode {}".format(mode))
+    shutil.copy(src, dst)
+
+def chunked(iterable, n):
+    """ Yield lists of at most n consecutive items from iterable. """
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk: return
+        yield chunk
@@ -0,0 +1,226 @@
+# Metarunlog, experiment management tool.
+# Date: 2026-10-17
+# Change detection for mrl watch: inotify through ctypes on local filesystems,
+# and a polling fallback (stat of the subExp files) for NFS and other network filesystems.
+# Both report which experiment dirs changed, the Watcher keeps the done status in memory
+# and runs a callback (re-analysis) once an experiment has been quiet for a debounce period.
+
+import os
+import sys
+import time
+import errno
+import struct
+import select
+from os.path import join, isdir, isfile
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0x00000800
+IN_CLOEXEC     = 0x00080000
+watchMask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+eventHeader = struct.Struct('iIII') # wd, mask, cookie, len
+
+networkFsTypes = ['nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'lustre', 'gpfs', 'fuse.sshfs', 'afs', 'ceph', 'beegfs']
+
+def ignored(name, analysisDir):
+    """ Files that mrl writes itself (analysis output, caches, metrics store) don't count as changes. """
+    return name == analysisDir or (name.startswith('.mrl.') and name != '.mrl.done') or name.endswith('.tmp')
+
+def fsType(path):
+    """ Filesystem type of the mount containing path, from /proc/mounts (None if unknown). """
+    path, best, fstype = os.path.realpath(path), '', None
+    try:
+        with open('/proc/mounts') as fh:
+            for line in fh:
+                fields = line.split()
+                mnt = fields[1].replace('\\040', ' ')
+                if (path == mnt or path.startswith(mnt.rstrip('/') + '/')) and len(mnt) >= len(best):
+                    best, fstype = mnt, fields[2]
+    except IOError:
+        pass
+    return fstype
+
+class Inotify:
+    """ Watches outdir, the expDirs and their subExpDirs. poll() returns the set of changed expDir names. """
+    def __init__(self, outdir, expDirNames, analysisDir):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.outdir, self.analysisDir = outdir, analysisDir
+        self.wds = {} # wd -> (expDirName or None for outdir, subExpId or None)
+        self._add(outdir, None, None)
+        for expDirName in expDirNames:
+            self.addExp(expDirName)
+
+    def _add(self, path, expDirName, subExpId):
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, path.encode('utf-8') if isinstance(path, unicode) else path, watchMask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, 'inotify watch limit reached, raise fs.inotify.max_user_watches or use -poll')
+            return # dir disappeared in the meantime
+        self.wds[wd] = (expDirName, subExpId)
+
+    def addExp(self, expDirName):
+        expDir = join(self.outdir, expDirName)
+        self._add(expDir, expDirName, None)
+        for name in os.listdir(expDir):
+            if not ignored(name, self.analysisDir) and isdir(join(expDir, name)):
+                self._add(join(expDir, name), expDirName, name)
+
+    def poll(self, timeout):
+        changed, newExps = set(), []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed, newExps
+        time.sleep(0.05) # gather a burst of events in one read
+        data = os.read(self.fd, 1 << 16)
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = eventHeader.unpack_from(data, pos)
+            name = data[pos + eventHeader.size: pos + eventHeader.size + length].rstrip('\0')
+            pos += eventHeader.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(e for e, s in self.wds.values() if e)
+                continue
+            if mask & IN_IGNORED:
+                self.wds.pop(wd, None)
+                continue
+            if wd not in self.wds or ignored(name, self.analysisDir): continue
+            expDirName, subExpId = self.wds[wd]
+            if expDirName is None: # outdir: a new experiment
+                if mask & (IN_CREATE | IN_MOVED_TO) and mask & IN_ISDIR: newExps.append(name)
+                continue
+            if subExpId is None and mask & (IN_CREATE | IN_MOVED_TO) and mask & IN_ISDIR:
+                self._add(join(self.outdir, expDirName, name), expDirName, name)
+            changed.add(expDirName)
+        return changed, newExps
+
+    def close(self):
+        os.close(self.fd)
+
+class Poller:
+    """ Same interface as Inotify, by comparing stats of the subExp files every interval seconds. """
+    def __init__(self, outdir, expDirNames, analysisDir, interval=10.):
+        self.outdir, self.analysisDir, self.interval = outdir, analysisDir, interval
+        self.expDirNames = set()
+        self.stats = {}
+        self.initialNames = set(os.listdir(outdir)) # not new, eg done exps that aren't watched
+        for expDirName in expDirNames:
+            self.addExp(expDirName)
+
+    def _scanExp(self, expDirName):
+        """ {relpath: (size, mtime)} of the files in expDir and its subdirs, skipping mrl's own output. """
+        expDir, stats = join(self.outdir, expDirName), {}
+        try:
+            names = os.listdir(expDir)
+        except OSError:
+            return stats
+        for name in names:
+            if ignored(name, self.analysisDir): continue
+            path = join(expDir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats[name] = (st.st_size, st.st_mtime)
+            if isdir(path):
+                for subname in os.listdir(path):
+                    if ignored(subname, self.analysisDir): continue
+                    try:
+                        st = os.stat(join(path, subname))
+                    except OSError:
+                        continue
+                    stats[join(name, subname)] = (st.st_size, st.st_mtime)
+        return stats
+
+    def addExp(self, expDirName):
+        self.expDirNames.add(expDirName)
+        self.stats[expDirName] = self._scanExp(expDirName)
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for expDirName in self.expDirNames:
+            stats = self._scanExp(expDirName)
+            if stats != self.stats[expDirName]:
+                changed.add(expDirName)
+                self.stats[expDirName] = stats
+        newExps = [name for name in os.listdir(self.outdir) if name not in self.expDirNames and name not in self.initialNames]
+        return changed, newExps
+
+    def close(self):
+        pass
+
+class Watcher:
+    """
+    Keeps {expDirName: (nDone, nSubExps, expDone)} up to date from the change notifications,
+    prints status changes and calls onQuiet(expDirName) when an experiment that changed
+    has seen no changes for debounce seconds.
+    """
+    def __init__(self, outdir, expDirNames, analysisDir, isExp, onQuiet=None, debounce=30., poll=False, interval=10., vfh=sys.stdout):
+        self.outdir, self.analysisDir, self.isExp = outdir, analysisDir, isExp
+        self.onQuiet, self.debounce, self.vfh = onQuiet, debounce, vfh
+        if not poll and fsType(outdir) in networkFsTypes:
+            vfh.write('{} is on {}, polling every {}s\n'.format(outdir, fsType(outdir), interval))
+            poll = True
+        self.notifier = None
+        if not poll:
+            try:
+                self.notifier = Inotify(outdir, expDirNames, analysisDir)
+            except (OSError, AttributeError) as e: # AttributeError: libc without inotify
+                vfh.write('inotify not available ({}), polling every {}s\n'.format(e, interval))
+        if not self.notifier:
+            self.notifier = Poller(outdir, expDirNames, analysisDir, interval)
+        self.status  = {expDirName: self._status(expDirName) for expDirName in expDirNames}
+        self.pending = {} # expDirName -> time of last change
+
+    def _status(self, expDirName):
+        expDir = join(self.outdir, expDirName)
+        subExps = [s for s in os.listdir(expDir) if s.isdigit() and isdir(join(expDir, s))]
+        nDone = sum(1 for s in subExps if isfile(join(expDir, s, '.mrl.done')))
+        return nDone, len(subExps), isfile(join(expDir, '.mrl.done'))
+
+    def statusLine(self, expDirName):
+        nDone, nSubExps, expDone = self.status[expDirName]
+        return '{} {}: {}/{} subExps done{}'.format(time.strftime('%H:%M:%S'), expDirName, nDone, nSubExps,
+                ', experiment done' if expDone else '')
+
+    def step(self, timeout):
+        changed, newExps = self.notifier.poll(timeout)
+        for name in newExps:
+            if self.isExp(name) and name not in self.status and isdir(join(self.outdir, name)):
+                self.notifier.addExp(name)
+                changed.add(name)
+        now = time.time()
+        for expDirName in changed:
+            status = self._status(expDirName)
+            if status != self.status.get(expDirName):
+                self.status[expDirName] = status
+                self.vfh.write(self.statusLine(expDirName) + '\n')
+            self.pending[expDirName] = now
+        for expDirName, t in sorted(self.pending.items()):
+            if now - t >= self.debounce:
+                del self.pending[expDirName]
+                if self.onQuiet: self.onQuiet(expDirName)
+        self.vfh.flush()
+
+    def run(self):
+        try:
+            while True:
+                timeout = min([self.debounce - (time.time() - t) for t in self.pending.values()] + [self.debounce])
+                self.step(max(timeout, 0.1))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.notifier.close()